@@ -0,0 +1,123 @@
+import queue
+import threading
+
+
+DEFAULT_FLUSH_SIZE = 1024*1024
+DEFAULT_QUEUE_SIZE = 64
+
+
+class BackgroundWriter:
+    '''
+    Writes files in a separate thread, so that the blocking writes overlap
+    with parsing and serialization in the main thread.
+
+    The file objects returned by `open()` collect the written data in
+    buffers of (at least) `flush_size` characters, which are passed to
+    the writer thread through a queue holding max. `queue_size` buffers.
+    '''
+
+    def __init__(self, flush_size=DEFAULT_FLUSH_SIZE,
+                 queue_size=DEFAULT_QUEUE_SIZE):
+        self.flush_size = flush_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.next_key = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        files = {}
+        while True:
+            op, key, data = self.queue.get()
+            try:
+                # after an error, only drain the queue
+                if op == 'stop' or self.error is not None:
+                    pass
+                elif op == 'open':
+                    files[key] = open(data, 'w+', buffering=self.flush_size)
+                elif op == 'write':
+                    files[key].write(data)
+                elif op == 'close':
+                    files.pop(key).close()
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+            if op == 'stop':
+                break
+        for fp in files.values():
+            fp.close()
+
+    def _check_error(self):
+        if self.error is not None:
+            raise RuntimeError(
+                'Error in the background writer: {}'.format(self.error)) \
+                from self.error
+
+    def _put(self, op, key=None, data=None):
+        self._check_error()
+        self.queue.put((op, key, data))
+
+    def open(self, path):
+        'Open a file for writing. Returns a file-like object.'
+        key = self.next_key
+        self.next_key += 1
+        self._put('open', key, path)
+        return _QueuedFile(self, key)
+
+    def sync(self):
+        'Wait until all the data queued so far has been written.'
+        self.queue.join()
+        self._check_error()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(('stop', None, None))
+            self.thread.join()
+        self._check_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # don't mask the original exception
+            try:
+                self.close()
+            except RuntimeError:
+                pass
+
+
+class _QueuedFile:
+    'A write-only file-like object passing its data to a BackgroundWriter.'
+
+    def __init__(self, writer, key):
+        self.writer = writer
+        self.key = key
+        self.buffer = []
+        self.size = 0
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.size += len(data)
+        if self.size >= self.writer.flush_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self.buffer:
+            self.writer._put('write', self.key, ''.join(self.buffer))
+            self.buffer = []
+            self.size = 0
+
+    def close(self):
+        self.flush()
+        self.writer._put('close', self.key)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
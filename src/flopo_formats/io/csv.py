@@ -248,7 +248,7 @@ def load_annotation_from_csv(docs, filename, annotation_name):
             yield doc
 
 
-def write_split_csv(docs, path, n):
+def write_split_csv(docs, path, n, background_writer=None):
     if not path.endswith('.csv'):
         logging.warning(
             'Output format is `csv`, but the output file didn\'t have .csv'
@@ -265,7 +265,8 @@ def write_split_csv(docs, path, n):
                     fp.close()
                 n_file += 1
                 p = path.replace('.csv', '.{}.csv').format(n_file)
-                fp = open(p, 'w+')
+                fp = background_writer.open(p) \
+                     if background_writer is not None else open(p, 'w+')
                 writer = CSVCorpusWriter(fp)
             writer.write(next(docs))
             n_docs += 1
@@ -1,39 +1,161 @@
+from fnmatch import fnmatch
+import functools
+import hashlib
+import io
+import json
 import logging
+import multiprocessing
 import os
 import os.path
+import zipfile
 
+from flopo_formats.io.background import BackgroundWriter, DEFAULT_FLUSH_SIZE
 from flopo_formats.io.conll import CoNLLCorpusReader
 from flopo_formats.io.csv import \
     CSVCorpusReader, CSVCorpusWriter, write_split_csv
+from flopo_formats.io.webannoproject import WebAnnoProjectWriter
 from flopo_formats.io.webannotsv import WebAnnoTSVReader, write_webanno_tsv
 from flopo_formats.io.prolog import write_prolog
 
 
-def _get_filenames(path, recursive=False):
+MANIFEST_FILENAME = '.flopo-manifest.json'
+# the entries read from a zip file if no `include` patterns are given
+# (the source documents of a WebAnno project)
+DEFAULT_ZIP_INCLUDE = ['source/*']
+ZIP_CHUNKSIZE = 16
+
+
+def _matches_any(name, relpath, patterns):
+    return any(fnmatch(name, p) or fnmatch(relpath, p) for p in patterns)
+
+
+def _scan_dir(path, relpath, recursive, include, exclude, sort):
+    with os.scandir(path) as it:
+        # the directory has to be read completely in order to sort it,
+        # but the subdirectories are only scanned once they are reached,
+        # so that the first files are yielded immediately
+        entries = sorted(it, key=lambda e: e.name) if sort else it
+        for entry in entries:
+            entry_relpath = os.path.join(relpath, entry.name) \
+                            if relpath else entry.name
+            # DirEntry caches the file type -- no additional stat() calls
+            if entry.is_dir(follow_symlinks=False):
+                if recursive:
+                    yield from _scan_dir(
+                        entry.path, entry_relpath, recursive,
+                        include, exclude, sort)
+            elif entry.is_file() and entry.name != MANIFEST_FILENAME:
+                if include and \
+                        not _matches_any(entry.name, entry_relpath, include):
+                    continue
+                if exclude and \
+                        _matches_any(entry.name, entry_relpath, exclude):
+                    continue
+                yield entry.path
+
+
+def _get_filenames(path, recursive=False, include=None, exclude=None,
+                   sort=True):
+    '''
+    Generate the names of the files contained in `path` (or `path` itself,
+    if it is a file).
+
+    `include` and `exclude` are lists of glob patterns, which are matched
+    against the file name and the path relative to `path`. If `sort` is
+    set, the directory entries are visited in alphabetical order.
+    '''
     if os.path.isfile(path):
-        return [path]
+        yield path
     elif os.path.isdir(path):
-        results = []
-        if not recursive:
-            for f in os.listdir(path):
-                filename = os.path.join(path, f)
-                if os.path.isfile(filename):
-                    results.append(filename)
-        else:
-            for dirname, dirs, files in os.walk(path):
-                results.extend([os.path.join(dirname, f) for f in files])
-        return results
+        yield from _scan_dir(path, '', recursive, include, exclude, sort)
     else:
         raise RuntimeError('File: \'{}\' does not exist!'.format(path))
 
 
+def _get_zip_entries(zf, include=None, exclude=None):
+    if include is None:
+        include = DEFAULT_ZIP_INCLUDE
+    for name in sorted(zf.namelist()):
+        if name.endswith('/'):
+            continue
+        basename = name.rsplit('/', 1)[-1]
+        if not _matches_any(basename, name, include):
+            continue
+        if exclude and _matches_any(basename, name, exclude):
+            continue
+        yield name
+
+
+# the zip file opened in a worker process of `read_webanno_zip()`
+_worker_zip = None
+
+
+def _init_zip_worker(path):
+    global _worker_zip
+    _worker_zip = zipfile.ZipFile(path)
+
+
+def zip_entry_doc_id(name):
+    '''
+    Determine the document ID from a zip entry name: in the layout of
+    WebAnno exports (`annotation/DOC/USER.tsv`, `curation/DOC/USER.tsv`),
+    it is the directory name, otherwise the file name without `.tsv`.
+    '''
+    parts = name.split('/')
+    if len(parts) >= 3 and parts[0] in ('annotation', 'curation'):
+        return parts[-2].replace('.tsv', '')
+    return parts[-1].replace('.tsv', '')
+
+
+def _read_zip_entry(zf, name, layers=None):
+    with io.TextIOWrapper(zf.open(name), encoding='utf-8') as fp:
+        doc = WebAnnoTSVReader(layers).read(fp)
+    doc.doc_id = zip_entry_doc_id(name)
+    return doc
+
+
+def _read_zip_entry_in_worker(name, layers=None):
+    return _read_zip_entry(_worker_zip, name, layers)
+
+
+def read_webanno_zip(path, include=None, exclude=None, jobs=1, layers=None):
+    '''
+    Read WebAnno-TSV documents directly from a zip file (e.g. an exported
+    WebAnno project), without extracting it. `include` and `exclude` are
+    lists of glob patterns matched against the entry names (default:
+    `source/*`), e.g. `annotation/*/*.tsv`. The document IDs are derived
+    from the entry names by `zip_entry_doc_id()`. If `jobs` > 1, the
+    documents are parsed in parallel processes (but returned in the order
+    of the entries). If `layers` is given, only these annotation layers
+    are read.
+    '''
+    with zipfile.ZipFile(path) as zf:
+        names = list(_get_zip_entries(zf, include, exclude))
+        if jobs > 1:
+            with multiprocessing.Pool(
+                    jobs, initializer=_init_zip_worker, initargs=(path,)) \
+                    as pool:
+                yield from pool.imap(
+                    functools.partial(
+                        _read_zip_entry_in_worker, layers=layers),
+                    names,
+                    chunksize=ZIP_CHUNKSIZE)
+        else:
+            for name in names:
+                yield _read_zip_entry(zf, name, layers)
+
+
 # FIXME rename parameters to: "path", "format"
-def read_docs(path, _format, recursive):
-    '''Returns a generator of documents.'''
+def read_docs(path, _format, recursive, include=None, exclude=None, jobs=1):
+    '''
+    Returns a generator of documents. `include` and `exclude` are lists
+    of glob patterns used to filter the files if `path` is a directory
+    (or the entries if it is a zip file in the "webanno-tsv" format).
+    '''
 
     if _format == 'conll':
         reader = CoNLLCorpusReader()
-        for filename in _get_filenames(path, recursive):
+        for filename in _get_filenames(path, recursive, include, exclude):
             # FIXME don't remove the extension
             reader.set_next_doc_id(filename.replace('.txt', ''))
             with open(filename) as fp:
@@ -44,8 +166,10 @@ def read_docs(path, _format, recursive):
             for doc in CSVCorpusReader().read(fp):
                 yield doc
     elif _format == 'webanno-tsv':
-        if os.path.isdir(path):
-            for filename in _get_filenames(path, recursive):
+        if os.path.isfile(path) and zipfile.is_zipfile(path):
+            yield from read_webanno_zip(path, include, exclude, jobs)
+        elif os.path.isdir(path):
+            for filename in _get_filenames(path, recursive, include, exclude):
                 with open(filename) as fp:
                     doc = WebAnnoTSVReader().read(fp)
                     doc.doc_id = filename
@@ -57,59 +181,197 @@ def read_docs(path, _format, recursive):
         raise NotImplementedError()
 
 
+def _doc_fingerprint(doc):
+    '''
+    Compute a hash of the document's token rows and the annotation rows
+    of all its layers.
+    '''
+    h = hashlib.sha1()
+    for layer, features in doc.schema:
+        h.update('{}\t{}\n'.format(layer, '|'.join(features)).encode())
+    for s in doc.sentences:
+        for t in s.tokens:
+            h.update('{}\t{}\t{}\t{}\t{}\t{}\t{}\n'.format(
+                s.sen_id, s.par_id, t.tok_id, t.string, t.space_after,
+                t.misc, sorted(t.annotations.items())).encode())
+    for layer, annotations in doc.annotations.items():
+        for a in annotations:
+            h.update('{}\t{}\t{}\t{}\t{}\t{}\n'.format(
+                layer, a.start_sen, a.start_tok, a.end_sen, a.end_tok,
+                sorted(a.items())).encode())
+    return h.hexdigest()
+
+
+def _load_manifest(path, _format):
+    '''
+    Load the fingerprints of the documents written by the previous run.
+    Returns an empty dict if there is no manifest, it is corrupt or it was
+    created for a different output format.
+    '''
+    filename = os.path.join(path, MANIFEST_FILENAME)
+    if not os.path.isfile(filename):
+        return {}
+    try:
+        with open(filename) as fp:
+            manifest = json.load(fp)
+        if not isinstance(manifest, dict) \
+                or not isinstance(manifest.get('documents'), dict):
+            raise ValueError('not a manifest')
+    except ValueError as e:
+        logging.warning(
+            'Ignoring corrupt manifest {}: {}'.format(filename, e))
+        return {}
+    if manifest.get('format') != _format:
+        logging.warning(
+            'Ignoring manifest created for a different output format: {}'\
+            .format(manifest.get('format')))
+        return {}
+    return manifest['documents']
+
+
+def _save_manifest(path, _format, documents):
+    filename = os.path.join(path, MANIFEST_FILENAME)
+    # write to a temporary file first, so that an interrupted run
+    # doesn't leave a broken manifest
+    with open(filename + '.tmp', 'w+') as fp:
+        json.dump({ 'format' : _format, 'documents' : documents }, fp)
+    os.replace(filename + '.tmp', filename)
+
+
+def _open_for_writing(path, background_writer=None):
+    if background_writer is not None:
+        return background_writer.open(path)
+    else:
+        return open(path, 'w+')
+
+
+def _write_docs_to_dir(docs, path, _format, write_fun, suffix='',
+                       incremental=False, background_writer=None):
+    '''
+    Write each document to a separate file in the directory `path`.
+    If `incremental` is set, the documents whose fingerprint matches the
+    one stored in the manifest from the previous run are skipped.
+    '''
+    manifest = _load_manifest(path, _format) if incremental else {}
+    new_manifest = {}
+    n_written, n_skipped = 0, 0
+    try:
+        for doc in docs:
+            filename = doc.doc_id + suffix
+            fingerprint = _doc_fingerprint(doc) if incremental else None
+            if fingerprint is not None \
+                    and manifest.get(filename) == fingerprint \
+                    and os.path.isfile(os.path.join(path, filename)):
+                new_manifest[filename] = fingerprint
+                n_skipped += 1
+                continue
+            with _open_for_writing(os.path.join(path, filename),
+                                   background_writer) as fp:
+                write_fun(doc, fp)
+            n_written += 1
+            if fingerprint is not None:
+                new_manifest[filename] = fingerprint
+    finally:
+        if incremental:
+            # make sure the documents listed in the manifest are really
+            # written before saving it
+            if background_writer is not None:
+                background_writer.sync()
+            _save_manifest(path, _format, new_manifest)
+            logging.info(
+                'Incremental write: {} documents written, {} unchanged'
+                ' documents skipped.'.format(n_written, n_skipped))
+
+
+def _write_single_doc(docs, path, write_fun, background_writer=None):
+    # save a single document
+    doc = next(docs)
+    with _open_for_writing(path, background_writer) as fp:
+        write_fun(doc, fp)
+    # if there are more documents, show a warning
+    try:
+        next(docs)
+        logging.warning(
+            'Multiple documents read, but the output path'
+            ' is not a directory. Only the first document was saved'
+            ' in: {}'.format(path))
+    except StopIteration:
+        pass
+
+
+def _write_webanno_project(docs, path, template, name=None):
+    '''
+    Write the documents as WebAnno-TSV directly into a WebAnno project
+    zip file. The project name defaults to the file name without
+    extension.
+    '''
+    if template is None:
+        raise RuntimeError(
+            'A project template is required for the output format'
+            ' "webanno-project".')
+    if name is None:
+        name = os.path.splitext(os.path.basename(path))[0]
+    with WebAnnoProjectWriter(path, name, template) as writer:
+        for doc in docs:
+            fp = io.StringIO()
+            write_webanno_tsv(doc, fp)
+            writer.write(doc.doc_id, fp.getvalue().encode('utf-8'))
+
+
 # FIXME rename parameters to: "path", "format"
-def write_docs(docs, path, _format, n = None):
+def write_docs(docs, path, _format, n = None, incremental=False,
+               background=False, flush_size=DEFAULT_FLUSH_SIZE,
+               template=None, project_name=None):
+    '''
+    Write documents to `path` in the given format. If `background` is set,
+    the output files are written in a separate thread in chunks of
+    `flush_size` characters. `template` (the project metadata) and
+    `project_name` are used by the "webanno-project" format.
+    '''
+    if background:
+        with BackgroundWriter(flush_size=flush_size) as background_writer:
+            _write_docs(docs, path, _format, n, incremental,
+                        background_writer, template, project_name)
+    else:
+        _write_docs(docs, path, _format, n, incremental,
+                    template=template, project_name=project_name)
+
+
+def _write_docs(docs, path, _format, n = None, incremental=False,
+                background_writer=None, template=None, project_name=None):
     if n is not None:
         if _format == 'csv':
-            return write_split_csv(docs, path, n)
+            return write_split_csv(docs, path, n, background_writer)
         else:
             logging.warning(
                 '-n option ignored -- only relevant for output format "csv"')
+    if incremental and not os.path.isdir(path):
+        logging.warning(
+            'Incremental mode ignored -- only relevant when writing'
+            ' to a directory.')
 
     # normal writing - without splitting the output files
     if _format == 'csv':
-        with open(path, 'w+') as fp:
+        with _open_for_writing(path, background_writer) as fp:
             writer = CSVCorpusWriter(fp)
             for doc in docs:
                 writer.write(doc)
     elif _format == 'webanno-tsv':
         if os.path.isdir(path):
-            for doc in docs:
-                with open(os.path.join(path, doc.doc_id), 'w+') as fp:
-                    write_webanno_tsv(doc, fp)
+            _write_docs_to_dir(docs, path, _format, write_webanno_tsv,
+                               incremental=incremental,
+                               background_writer=background_writer)
         else:
-            # save a single document
-            doc = next(docs)
-            with open(path, 'w+') as fp:
-                write_webanno_tsv(doc, fp)
-            # if there are more documents, show a warning
-            try:
-                next(docs)
-                logging.warning(
-                    'Multiple documents read, but the output path'
-                    ' is not a directory. Only the first document was saved'
-                    ' in: {}'.format(path))
-            except StopIteration:
-                pass
+            _write_single_doc(docs, path, write_webanno_tsv,
+                              background_writer)
+    elif _format == 'webanno-project':
+        _write_webanno_project(docs, path, template, project_name)
     elif _format == 'prolog':
         if os.path.isdir(path):
-            for doc in docs:
-                with open(os.path.join(path, doc.doc_id+'.pl'), 'w+') as fp:
-                    write_prolog(doc, fp)
+            _write_docs_to_dir(docs, path, _format, write_prolog,
+                               suffix='.pl', incremental=incremental,
+                               background_writer=background_writer)
         else:
-            # save a single document
-            doc = next(docs)
-            with open(path, 'w+') as fp:
-                write_prolog(doc, fp)
-            # if there are more documents, show a warning
-            try:
-                next(docs)
-                logging.warning(
-                    'Multiple documents read, but the output path'
-                    ' is not a directory. Only the first document was saved'
-                    ' in: {}'.format(path))
-            except StopIteration:
-                pass
+            _write_single_doc(docs, path, write_prolog, background_writer)
     else:
         raise NotImplementedError()
-
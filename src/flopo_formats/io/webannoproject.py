@@ -0,0 +1,197 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import json
+import struct
+import time
+import zipfile
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED
+import zlib
+
+
+DEFAULT_COMPRESSION_LEVEL = 6
+SOURCE_DOCUMENT_TEMPLATE = {
+    'name' : None,
+    'format' : 'ctsv3',
+    'state' : 'NEW',
+    'timestamp' : None,
+    'sentence_accessed' : 0,
+    'created' : None,
+    'updated' : None
+}
+
+
+def load_template(template_file):
+    template = None
+    with open(template_file) as fp:
+        template = json.load(fp)
+    return template
+
+
+def compress_entry(zinfo, data, compresslevel=DEFAULT_COMPRESSION_LEVEL,
+                   store=False):
+    '''
+    Compress the data of a zip entry. Sets the CRC, sizes and compression
+    type in `zinfo` and returns the compressed data to be written with
+    `write_raw_entry()`.
+    '''
+    zinfo.file_size = len(data)
+    zinfo.CRC = zlib.crc32(data)
+    if store:
+        zinfo.compress_type = ZIP_STORED
+    else:
+        zinfo.compress_type = ZIP_DEFLATED
+        # raw deflate stream, as used in zip files
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+        data = compressor.compress(data) + compressor.flush()
+    zinfo.compress_size = len(data)
+    return data
+
+
+def compress_file(path, arcname, compresslevel=DEFAULT_COMPRESSION_LEVEL,
+                  store=False, old_entries=None):
+    '''
+    Read and compress a file. Returns a pair: (zinfo, data), where `data`
+    is the compressed entry to be written with `write_raw_entry()`.
+
+    `old_entries` is a dict of ZipInfo objects of an existing zip file.
+    If it contains an entry `arcname` with the same size and CRC as the
+    file, the file is not compressed and the pair: (old_zinfo, None)
+    is returned instead.
+    '''
+    zinfo = ZipInfo.from_file(path, arcname)
+    with open(path, 'rb') as fp:
+        data = fp.read()
+    if old_entries is not None and arcname in old_entries:
+        old_zinfo = old_entries[arcname]
+        if old_zinfo.file_size == len(data) \
+                and old_zinfo.CRC == zlib.crc32(data):
+            return old_zinfo, None
+    return zinfo, compress_entry(zinfo, data, compresslevel, store)
+
+
+def compress_files(paths, arcnames, jobs,
+                   compresslevel=DEFAULT_COMPRESSION_LEVEL, store=False,
+                   old_entries=None):
+    '''
+    Compress files in a thread pool (zlib releases the GIL). Yields the
+    results of `compress_file()` in the order of the input, keeping max.
+    `2*jobs` files in memory.
+    '''
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        for path, arcname in zip(paths, arcnames):
+            pending.append(executor.submit(
+                compress_file, path, arcname, compresslevel, store,
+                old_entries))
+            if len(pending) >= 2*jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def write_raw_entry(zf, zinfo, data):
+    '''
+    Append an already compressed entry to a ZipFile opened for writing.
+    `zinfo` must have the CRC, sizes and compression type set.
+
+    The ZipFile API can only write uncompressed data, so this uses its
+    internals in the same way as `ZipFile.open(..., mode='w')`.
+    '''
+    # Relies on private ZipFile internals (`_lock`, `_writing`,
+    # `_writecheck()`, `start_dir`, `_didModify`), which are the same in
+    # CPython 3.6-3.13 (tested with 3.11). Check them when upgrading.
+    if zf._writing:
+        raise RuntimeError(
+            'Cannot write to the zip file while another entry is open.')
+    with zf._lock:
+        zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT \
+                or zinfo.compress_size > zipfile.ZIP64_LIMIT
+        zinfo.flag_bits = 0
+        zf.fp.seek(zf.start_dir)
+        zinfo.header_offset = zf.fp.tell()
+        zf._writecheck(zinfo)
+        zf._didModify = True
+        zf.fp.write(zinfo.FileHeader(zip64))
+        zf.fp.write(data)
+        zf.start_dir = zf.fp.tell()
+        zf.filelist.append(zinfo)
+        zf.NameToInfo[zinfo.filename] = zinfo
+
+
+def read_raw_entry(zf, zinfo):
+    '''
+    Read the compressed data of an entry of a ZipFile opened for reading.
+    Returns a pair: (zinfo, data), where `zinfo` is a copy of the entry
+    information that can be passed to `write_raw_entry()` with `data`.
+    '''
+    # Relies on `ZipFile._lock` and the private `zipfile._FH_*` local
+    # header field indices, the same in CPython 3.6-3.13 (tested with 3.11).
+    if zinfo.flag_bits & 0x1:
+        raise RuntimeError(
+            'Cannot copy an encrypted entry: {}'.format(zinfo.filename))
+    with zf._lock:
+        zf.fp.seek(zinfo.header_offset)
+        header = struct.unpack(
+            zipfile.structFileHeader, zf.fp.read(zipfile.sizeFileHeader))
+        if header[zipfile._FH_SIGNATURE] != zipfile.stringFileHeader:
+            raise RuntimeError(
+                'Bad local file header of entry: {}'.format(zinfo.filename))
+        zf.fp.seek(header[zipfile._FH_FILENAME_LENGTH] \
+                   + header[zipfile._FH_EXTRA_FIELD_LENGTH], 1)
+        data = zf.fp.read(zinfo.compress_size)
+    new_zinfo = ZipInfo(zinfo.filename, date_time=zinfo.date_time)
+    for attr in ('compress_type', 'CRC', 'file_size', 'compress_size',
+                 'external_attr', 'create_system'):
+        setattr(new_zinfo, attr, getattr(zinfo, attr))
+    return new_zinfo, data
+
+
+class WebAnnoProjectWriter:
+    '''
+    Writes a WebAnno project (a zip file ready to import to WebAnno):
+    the source documents are stored under `source/` and the project
+    metadata (`exportedproject.json`), based on `template`, is written
+    when the writer is closed.
+    '''
+
+    def __init__(self, path, name, template,
+                 compresslevel=DEFAULT_COMPRESSION_LEVEL, store=False):
+        self.name = name
+        self.template = template
+        self.compresslevel = compresslevel
+        self.store = store
+        self.sources = []
+        self.zip = ZipFile(path, 'w', compression=ZIP_DEFLATED)
+
+    def write(self, source_name, data):
+        'Compress and add a source document (`data` are bytes).'
+        zinfo = ZipInfo('source/' + source_name,
+                        date_time=time.localtime(time.time())[:6])
+        zinfo.external_attr = 0o644 << 16
+        self.write_compressed(
+            source_name, zinfo,
+            compress_entry(zinfo, data, self.compresslevel, self.store))
+
+    def write_compressed(self, source_name, zinfo, data):
+        'Add a source document compressed with `compress_entry()`.'
+        write_raw_entry(self.zip, zinfo, data)
+        self.sources.append(source_name)
+
+    def copy(self, source_name, zf, zinfo):
+        'Copy a source document from another zip file without recompressing.'
+        self.write_compressed(source_name, *read_raw_entry(zf, zinfo))
+
+    def close(self):
+        project = dict(self.template)
+        project['name'] = self.name
+        project['source_documents'] = \
+            [{ **SOURCE_DOCUMENT_TEMPLATE, 'name' : source } \
+             for source in self.sources]
+        self.zip.writestr('exportedproject.json', json.dumps(project))
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
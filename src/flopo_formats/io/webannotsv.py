@@ -49,10 +49,17 @@ def _webanno_unescape(string):
 
 
 class WebAnnoTSVReader:
+    '''
+    Reads a WebAnno-TSV document. If `layers` (a set of layer names) is
+    given, only these layers are read -- the columns of other layers
+    are skipped without parsing and left out of the document schema.
+    '''
     FORMAT_DECLARATION = '#FORMAT=WebAnno TSV 3.2\n'
 
-    def __init__(self):
+    def __init__(self, layers=None):
+        self.layers = layers
         self.schema = []
+        self.columns = []
         self.sentences = []
         self.tokens = []
         self.last_span = None
@@ -83,12 +90,30 @@ class WebAnnoTSVReader:
             raise Exception('Two empty lines after header missing.')
         return schema
 
+    def _select_columns(self, schema):
+        '''
+        Select the layers to read from the schema. Returns a pair:
+        (columns, maxsplit), where `columns` is a list of triples:
+        (layer, features, offset) -- the index of the first column of
+        the layer in the row -- and `maxsplit` is the number of splits
+        needed to obtain all selected columns of a row (-1 for all).
+        '''
+        columns, offset = [], 3
+        for layer, features in schema:
+            if self.layers is None or layer in self.layers:
+                columns.append((layer, features, offset))
+            offset += len(features)
+        maxsplit = -1
+        if self.layers is not None:
+            maxsplit = columns[-1][2] + len(columns[-1][1]) if columns else 3
+        return columns, maxsplit
+
     def _token_from_row(self, row, idx):
-        tok_id = int(row.pop(0).split('-')[1])
-        start_idx, end_idx = tuple(map(int, row.pop(0).split('-')))
+        tok_id = int(row[0].split('-')[1])
+        start_idx, end_idx = tuple(map(int, row[1].split('-')))
         # sp is the space before the currently read token
         sp = ' ' if start_idx-idx > 0 else ''
-        string = row.pop(0)
+        string = row[2]
         # TODO space after
         return Token(tok_id, string), sp, end_idx
 
@@ -183,7 +208,9 @@ class WebAnnoTSVReader:
         self.sen_text_lines = []
 
     def read(self, fp):
-        self.schema = self._read_header(fp)
+        self.columns, maxsplit = self._select_columns(self._read_header(fp))
+        self.schema = [(layer, features) \
+                       for layer, features, offset in self.columns]
         self.annotations = \
             { layer: [] for layer, features in self.schema \
                         if layer not in WEBANNO_SINGLE_TOKEN_LAYERS}
@@ -202,17 +229,17 @@ class WebAnnoTSVReader:
                     self.sen_text_lines.append(line[len('#Text='):])
                 # other lines starting with "#" are ignored
             else:
-                row = line.split('\t')
+                row = line.split('\t', maxsplit)
                 t, sp, newidx = self._token_from_row(row, idx)
                 idx = newidx
                 # fix the space_after of the previous token
                 if self.tokens:
                     self.tokens[-1].space_after = sp
                 self.tokens.append(t)
-                for layer, features in self.schema:
+                for layer, features, offset in self.columns:
                     values, span_ids = {}, {}
-                    for f in features:
-                        values[f], span_ids[f] = self._parse_cell(row.pop(0))
+                    for i, f in enumerate(features, offset):
+                        values[f], span_ids[f] = self._parse_cell(row[i])
                         # if feature is "head" -- remove the sentence ID
                         # and set to 0 for root
                         if f == 'head':
@@ -342,7 +369,7 @@ def save_webanno_tsv(document, filename):
         write_webanno_tsv(document, fp)
 
 
-def load_webanno_tsv(filename):
+def load_webanno_tsv(filename, layers=None):
     with open(filename) as fp:
-        return WebAnnoTSVReader().read(fp)
+        return WebAnnoTSVReader(layers).read(fp)
 
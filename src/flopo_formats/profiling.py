@@ -0,0 +1,118 @@
+import argparse
+import cProfile
+import functools
+import logging
+import os
+import threading
+import tracemalloc
+
+
+PROFILE_ENV_VAR = 'FLOPO_PROFILE'
+PROFILE_MEMORY_ENV_VAR = 'FLOPO_PROFILE_MEMORY'
+MEMORY_SAMPLING_INTERVAL = 0.5
+MEMORY_TRACEBACK_DEPTH = 10
+MEMORY_TOP_SITES = 50
+# the values of the environment variables recognized as "enabled"
+TRUE_VALUES = { '1', 'true', 'yes' }
+
+
+def add_profiling_arguments(parser):
+    'Add the profiling options to an argument parser.'
+    group = parser.add_argument_group('profiling')
+    group.add_argument(
+        '--profile', metavar='FILE',
+        help='Save a cProfile profile of the run to FILE (readable by'\
+             ' pstats or snakeviz). Can also be enabled by setting the'\
+             ' environment variable {}=FILE.'.format(PROFILE_ENV_VAR))
+    group.add_argument(
+        '--profile-memory', default=False, action='store_true',
+        help='In combination with --profile: trace the memory allocations'\
+             ' and save the peak memory usage by call site to FILE.mem.txt.'\
+             ' Can also be enabled by setting the environment variable'\
+             ' {}=1 (or "true", "yes").'.format(PROFILE_MEMORY_ENV_VAR))
+
+
+class _MemorySampler(threading.Thread):
+    '''
+    Periodically check the traced memory and take a snapshot whenever
+    the allocated memory reaches a new maximum.
+    '''
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.stopped = threading.Event()
+        self.peak = 0
+        self.snapshot = None
+
+    def sample(self):
+        current, peak = tracemalloc.get_traced_memory()
+        if current > self.peak:
+            self.peak = current
+            self.snapshot = tracemalloc.take_snapshot()
+
+    def run(self):
+        while not self.stopped.wait(MEMORY_SAMPLING_INTERVAL):
+            self.sample()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.sample()
+
+
+def _save_memory_profile(sampler, filename):
+    current, peak = tracemalloc.get_traced_memory()
+    with open(filename, 'w+') as fp:
+        fp.write('peak traced memory: {:.1f} MiB\n'.format(peak / 2**20))
+        fp.write('largest sampled memory: {:.1f} MiB\n\n'\
+                 .format(sampler.peak / 2**20))
+        if sampler.snapshot is not None:
+            for stat in sampler.snapshot.statistics('traceback')\
+                                         [:MEMORY_TOP_SITES]:
+                fp.write('{:.1f} KiB in {} blocks\n'.format(
+                    stat.size / 1024, stat.count))
+                for line in stat.traceback.format():
+                    fp.write(line + '\n')
+                fp.write('\n')
+
+
+def _env_flag(name):
+    return os.environ.get(name, '').strip().lower() in TRUE_VALUES
+
+
+def profiled(main):
+    '''
+    Decorator for the `main()` functions of the scripts: if profiling is
+    enabled via the command line (see `add_profiling_arguments()`) or
+    environment variables, run `main()` under the profiler.
+    '''
+
+    @functools.wraps(main)
+    def _main(*args, **kwargs):
+        parser = argparse.ArgumentParser(add_help=False)
+        add_profiling_arguments(parser)
+        prof_args, _ = parser.parse_known_args()
+        output_file = prof_args.profile or os.environ.get(PROFILE_ENV_VAR)
+        profile_memory = prof_args.profile_memory \
+                         or _env_flag(PROFILE_MEMORY_ENV_VAR)
+        if not output_file:
+            return main(*args, **kwargs)
+        sampler = None
+        if profile_memory:
+            tracemalloc.start(MEMORY_TRACEBACK_DEPTH)
+            sampler = _MemorySampler()
+            sampler.start()
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(main, *args, **kwargs)
+        finally:
+            profile.dump_stats(output_file)
+            logging.info('Profile saved to: {}'.format(output_file))
+            if sampler is not None:
+                sampler.stop()
+                _save_memory_profile(sampler, output_file + '.mem.txt')
+                tracemalloc.stop()
+                logging.info('Memory profile saved to: {}'\
+                             .format(output_file + '.mem.txt'))
+
+    return _main
@@ -2,10 +2,15 @@ import argparse
 import logging
 import os
 import os.path
+import sys
 
 from flopo_formats.data import Corpus
+from flopo_formats.io.background import DEFAULT_FLUSH_SIZE
 from flopo_formats.io.generic import read_docs, write_docs
 from flopo_formats.io.csv import load_annotation_from_csv
+from flopo_formats.io.webannoproject import load_template
+from flopo_formats.profiling import add_profiling_arguments, profiled
+from flopo_formats.stats import Statistics
 
 
 def parse_annotation_source(source):
@@ -23,7 +28,7 @@ def parse_arguments():
         choices=['conll', 'csv', 'webanno-tsv'],
         help='input file format')
     parser.add_argument('-t', '--to', dest='output_format',
-        choices=['csv', 'webanno-tsv', 'prolog'],
+        choices=['csv', 'webanno-tsv', 'webanno-project', 'prolog'],
         help='output file format')
     parser.add_argument('-i', '--input-path', metavar='PATH',
         help='path to the input file or directory')
@@ -33,16 +38,57 @@ def parse_arguments():
         help='split the output file to parts containing max. N documents')
     parser.add_argument('-r', '--recursive', default=False, action='store_true',
         help='in combination with -I, search also subdirectories')
+    parser.add_argument(
+        '--include', nargs='+', metavar='PATTERN',
+        help='if reading input from a directory, read only the files'\
+             ' matching one of the glob patterns')
+    parser.add_argument(
+        '--exclude', nargs='+', metavar='PATTERN',
+        help='if reading input from a directory, skip the files'\
+             ' matching one of the glob patterns')
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=1,
+        help='if reading WebAnno-TSV documents from a zip file: the number'\
+             ' of processes parsing the documents in parallel')
+    parser.add_argument(
+        '--template-file', metavar='FILE',
+        help='for output format webanno-project: the JSON file containing'\
+             ' the project template')
+    parser.add_argument(
+        '--project-name', metavar='NAME',
+        help='for output format webanno-project: the name of the project'\
+             ' (default: the output file name without extension)')
+    parser.add_argument(
+        '--incremental', default=False, action='store_true',
+        help='when writing to a directory, skip documents that haven\'t'\
+             ' changed since the previous run (according to a manifest'\
+             ' of document fingerprints kept in the output directory)')
+    parser.add_argument(
+        '--background-writer', default=False, action='store_true',
+        help='write the output files in a separate thread')
+    parser.add_argument(
+        '--flush-size', type=int, metavar='CHARS',
+        default=DEFAULT_FLUSH_SIZE,
+        help='in combination with --background-writer: the size of the'\
+             ' chunks (in characters) passed to the writer thread'\
+             ' (default: {})'.format(DEFAULT_FLUSH_SIZE))
     parser.add_argument(
         '-a', '--annotations', nargs='+', default=[],
         help='A list of annotations to include, each having the format:'\
              ' LAYER:FILE, where LAYER is the name of the layer'\
              ' (for example \'Hedging\') and FILE is a CSV file.'\
              ' Terminate the list with "--".')
+    parser.add_argument(
+        '--stats', default=False, action='store_true',
+        help='print a summary of counts and timings to stderr at the end')
+    parser.add_argument(
+        '--stats-json', metavar='FILE',
+        help='save the summary of counts and timings as JSON')
     parser.add_argument(\
         '-L', '--logging', default='WARNING',
         choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
         help='logging level')
+    add_profiling_arguments(parser)
     return parser.parse_args()
 
 
@@ -53,8 +99,13 @@ def check_arguments(args):
         raise RuntimeError('No input format supplied (use -f option).')
     if args.output_format is None:
         raise RuntimeError('No output format supplied (use -t option).')
+    if args.output_format == 'webanno-project' and args.template_file is None:
+        raise RuntimeError(
+            'Output format webanno-project requires a project template'
+            ' (use --template-file option).')
 
 
+@profiled
 def main():
     args = parse_arguments()
     check_arguments(args)
@@ -62,10 +113,26 @@ def main():
         level=args.logging,
         format='%(asctime)s - %(levelname)s - %(message)s',
         datefmt='%Y-%m-%d %H:%M')
-    docs = read_docs(args.input_path, args.input_format, args.recursive)
+    template = load_template(args.template_file) \
+               if args.template_file is not None else None
+    stats = Statistics()
+    docs = stats.stage(
+        'read',
+        read_docs(args.input_path, args.input_format, args.recursive,
+                  include=args.include, exclude=args.exclude,
+                  jobs=args.jobs))
     for a in args.annotations:
         layer, filename = parse_annotation_source(a)
-        docs = load_annotation_from_csv(docs, filename, layer)
-    write_docs(docs, args.output_path, args.output_format,
-               n = args.max_docs_per_file)
-
+        docs = stats.stage(
+            'merge:' + layer,
+            load_annotation_from_csv(docs, filename, layer))
+    with stats.measure('write'):
+        write_docs(stats.count(docs), args.output_path, args.output_format,
+                   n = args.max_docs_per_file, incremental=args.incremental,
+                   background=args.background_writer,
+                   flush_size=args.flush_size, template=template,
+                   project_name=args.project_name)
+    if args.stats:
+        stats.write_summary(sys.stderr)
+    if args.stats_json is not None:
+        stats.save_json(args.stats_json)
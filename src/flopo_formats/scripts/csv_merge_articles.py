@@ -1,6 +1,8 @@
 import argparse
 import csv
 
+from flopo_formats.profiling import add_profiling_arguments, profiled
+
 
 def group_blocks(rows):
     cur_doc_id, cur_block_id, cur_doc, cur_block = None, None, [], []
@@ -35,9 +37,11 @@ def parse_arguments():
     parser.add_argument('-i', '--input-file', metavar='FILE')
     parser.add_argument('-o', '--output-file', metavar='FILE')
     parser.add_argument('-p', '--parts-file', metavar='FILE')
+    add_profiling_arguments(parser)
     return parser.parse_args()
 
 
+@profiled
 def main():
     args = parse_arguments()
     with open(args.input_file) as infp, \
@@ -1,11 +1,18 @@
 import argparse
-from collections import defaultdict
+from array import array
+from collections import Counter, defaultdict, deque, namedtuple
+from contextlib import ExitStack
 import csv
-from operator import itemgetter
+import heapq
+import io
+from itertools import accumulate, chain, compress, groupby, repeat
+from operator import itemgetter, ne
+import random
 import sys
 import warnings
 
 from flopo_formats.data import Annotation
+from flopo_formats.profiling import add_profiling_arguments, profiled
 
 # TODO
 # - cleaner code
@@ -14,181 +21,498 @@ EXCLUDE_CSV_KEYS = { 'articleId', 'paragraphId', 'sentenceId', 'wordId',
                      'startWordId', 'endWordId', 'startSentenceId',
                      'endSentenceId' }
 
-def read_annotations(fp, only_doc_ids=None):
 
-    # TODO unify with io.read_annotation_from_csv
-    def _parse_line(line, features):
-        doc_id = line['articleId']
-        start_sen_id, end_sen_id = None, None
-        start_w_id, end_w_id = None, None
-        if 'startWordId' in line and 'endWordId' in line:
-            start_w_id = int(line['startWordId'])
-            end_w_id = int(line['endWordId'])
-        elif 'wordId' in line:
-            start_w_id = int(line['wordId'])
-            end_w_id = int(line['wordId'])
-        else:
-            raise Exception('No word ID')
-        if 'startSentenceId' in line and 'endSentenceId' in line:
-            start_sen_id = int(line['startSentenceId'])
-            end_sen_id = int(line['endSentenceId'])
-        elif 'sentenceId' in line:
-            start_sen_id = int(line['sentenceId'])
-            end_sen_id = int(line['sentenceId'])
-        else:
-            raise Exception('No sentence ID')
-        values = { '' : '' } if '' in features \
-                 else { key : line[key] for key in line \
-                        if key not in EXCLUDE_CSV_KEYS }
-        a = Annotation(start_sen_id, start_w_id, end_sen_id, end_w_id, values)
-        return doc_id, a
+# TODO unify with io.read_annotation_from_csv
+def _parse_annotation_line(line, features):
+    doc_id = line['articleId']
+    start_sen_id, end_sen_id = None, None
+    start_w_id, end_w_id = None, None
+    if 'startWordId' in line and 'endWordId' in line:
+        start_w_id = int(line['startWordId'])
+        end_w_id = int(line['endWordId'])
+    elif 'wordId' in line:
+        start_w_id = int(line['wordId'])
+        end_w_id = int(line['wordId'])
+    else:
+        raise Exception('No word ID')
+    if 'startSentenceId' in line and 'endSentenceId' in line:
+        start_sen_id = int(line['startSentenceId'])
+        end_sen_id = int(line['endSentenceId'])
+    elif 'sentenceId' in line:
+        start_sen_id = int(line['sentenceId'])
+        end_sen_id = int(line['sentenceId'])
+    else:
+        raise Exception('No sentence ID')
+    values = { '' : '' } if '' in features \
+             else { key : line[key] for key in line \
+                    if key not in EXCLUDE_CSV_KEYS }
+    a = Annotation(start_sen_id, start_w_id, end_sen_id, end_w_id, values)
+    return doc_id, a
 
-    # result: dict doc_id -> [Annotation]
-    result = defaultdict(lambda: list())
-    reader = csv.DictReader(fp)
+
+def _read_annotation_features(reader):
     features = tuple(k for k in reader.fieldnames if k not in EXCLUDE_CSV_KEYS)
     if not features:
         features = ('',)
+    return features
+
+
+def read_annotations(fp, only_doc_ids=None):
+    # result: dict doc_id -> [Annotation]
+    result = defaultdict(lambda: list())
+    reader = csv.DictReader(fp)
+    features = _read_annotation_features(reader)
     for line in reader:
-        doc_id, a = _parse_line(line, features)
+        doc_id, a = _parse_annotation_line(line, features)
         if only_doc_ids is None or doc_id in only_doc_ids:
             result[doc_id].append(a)
     return result, features
 
 
+def iter_annotations(fp):
+    '''
+    Like read_annotations(), but instead of a dictionary, return
+    a generator of pairs (doc_id, [Annotation]), in which the annotations
+    of each document are grouped together as they occur in the file.
+    '''
+
+    def _group(reader, features):
+        cur_doc_id, cur_anns = None, []
+        for line in reader:
+            doc_id, a = _parse_annotation_line(line, features)
+            if doc_id != cur_doc_id:
+                if cur_anns:
+                    yield cur_doc_id, cur_anns
+                cur_doc_id, cur_anns = doc_id, []
+            cur_anns.append(a)
+        if cur_anns:
+            yield cur_doc_id, cur_anns
+
+    reader = csv.DictReader(fp)
+    features = _read_annotation_features(reader)
+    return _group(reader, features), features
+
+
 def load_annotations(filename, only_doc_ids=None):
     result = None
     with open(filename) as fp:
         result = read_annotations(fp, only_doc_ids)
     return result
 
+
+def iter_corpus(fp):
+    '''
+    Read a corpus CSV file. Returns a generator of pairs (doc_id, doc),
+    where doc is a list of sentences, each being a list of tokens given
+    as pairs (word, upos). Only the columns needed for the evaluation
+    are read.
+    '''
+    reader = csv.reader(fp)
+    header = next(reader)
+    doc_id_idx, s_id_idx, word_idx, upos_idx = \
+        tuple(header.index(c) \
+              for c in ('articleId', 'sentenceId', 'word', 'upos'))
+    # plain tuples are much cheaper to create than named tuples -- this
+    # loop runs once per token of the corpus
+    get_token = itemgetter(word_idx, upos_idx)
+    get_s_id = itemgetter(s_id_idx)
+    for doc_id, lines in groupby(reader, itemgetter(doc_id_idx)):
+        yield doc_id, [list(map(get_token, s_lines)) \
+                       for s_id, s_lines in groupby(lines, get_s_id)]
+
+
 def load_corpus(filename, only_doc_ids=None):
     corpus = defaultdict(lambda: list())
-    cur_doc_id, cur_s_id, cur_sentence = None, None, None
     with open(filename) as fp:
-        reader = csv.DictReader(fp)
-        for line in reader:
-            doc_id = line['articleId']
+        for doc_id, doc in iter_corpus(fp):
             if only_doc_ids is None or doc_id in only_doc_ids:
-                s_id, word = int(line['sentenceId']), line['word']
-                if s_id != cur_s_id:
-                    if cur_s_id is not None:
-                        corpus[cur_doc_id].append(cur_sentence)
-                    cur_doc_id, cur_s_id, cur_sentence = doc_id, s_id, []
-                cur_sentence.append(line)
-        if cur_sentence:
-            corpus[cur_doc_id].append(cur_sentence)
+                corpus[doc_id].extend(doc)
     return corpus
 
 
-def unfold_annotations(doc, anns):
-    '''Create a vector of per-token annotations.'''
+class _SortedDocStream:
+    '''
+    A wrapper over a generator of pairs (doc_id, data) sorted by doc_id,
+    which allows to advance to a given document.
+    '''
+
+    def __init__(self, docs, name):
+        self.docs = iter(docs)
+        self.name = name
+        self.cur = next(self.docs, None)
+
+    def _advance(self):
+        prev_doc_id = self.cur[0]
+        self.cur = next(self.docs, None)
+        if self.cur is not None and self.cur[0] <= prev_doc_id:
+            raise RuntimeError(
+                '{} not sorted lexicographically by articleId: \'{}\' after'
+                ' \'{}\' (sort it e.g. with `LC_ALL=C sort`)'\
+                .format(self.name, self.cur[0], prev_doc_id))
+
+    def get(self, doc_id, default=None):
+        '''
+        Return the data for `doc_id`, skipping all the preceding
+        documents. Returns `default` if the document is not present.
+        '''
+        while self.cur is not None and self.cur[0] < doc_id:
+            self._advance()
+        if self.cur is not None and self.cur[0] == doc_id:
+            result = self.cur[1]
+            self._advance()
+            return result
+        return default
+
+    def __iter__(self):
+        while self.cur is not None:
+            cur = self.cur
+            self._advance()
+            yield cur
+
+
+class LabelIndex:
+    '''
+    Maps the annotation values to integer labels. The label 0 is reserved
+    for "no annotation".
+    '''
+
+    def __init__(self):
+        self.values = [None]
+        self.codes = { None : 0 }
+
+    def code(self, value):
+        if value not in self.codes:
+            self.codes[value] = len(self.values)
+            self.values.append(value)
+        return self.codes[value]
+
+    def __getitem__(self, code):
+        return self.values[code]
 
-    def _unfold_ann(results, a):
-        i, j = a.start_sen-1, a.start_tok-1
-        while i <= a.end_sen-1 and (i < a.end_sen-1 or j <= a.end_tok-1):
-            if i < len(results) and j < len(results[i]):
-                results[i][j] = a.features
+    def __len__(self):
+        return len(self.values)
+
+
+def sentence_offsets(doc):
+    '''
+    Return the positions of the sentence starts in a flat array of the
+    document's tokens, followed by the total number of tokens.
+    '''
+    return array('l', accumulate(map(len, doc), initial=0))
+
+
+def _span_offsets(offsets, a):
+    '''
+    Convert the span of an annotation to the (start, end) positions in
+    the flat token array (the end is exclusive). Spans exceeding the
+    sentence or document boundaries are truncated.
+    '''
+    n = len(offsets)-1
+    if a.start_sen < 1 or a.start_sen > n:
+        return 0, 0
+    sen_start, sen_end = offsets[a.start_sen-1], offsets[a.start_sen]
+    start = sen_start + a.start_tok-1
+    if start < sen_start:
+        start = sen_start
+    elif start > sen_end:
+        start = sen_end
+    if a.end_sen > n:
+        end = offsets[n]
+    else:
+        sen_start, sen_end = offsets[a.end_sen-1], offsets[a.end_sen]
+        end = sen_start + a.end_tok
+        if end > sen_end:
+            end = sen_end
+    return start, end
+
+
+def unfold_annotations(offsets, anns):
+    '''
+    Create an array containing for each token the index of the annotation
+    covering it in `anns` (or -1 if there is none).
+    '''
+    results = array('l', [-1]) * offsets[-1]
+    for k, a in enumerate(anns):
+        start, end = _span_offsets(offsets, a)
+        if start < end:
+            results[start:end] = array('l', [k]) * (end-start)
+    return results
+
+
+def _get_feature_value(ann, feature):
+    if ann is None:
+        return None
+    elif feature is None:
+        return True
+    else:
+        return ann[feature]
+
+
+def label_annotations(ann_idx, anns, feature, labels):
+    '''
+    Convert an array of annotation indices (as returned by
+    `unfold_annotations()`) to an array of labels of the given feature.
+    '''
+    # the last element is the label for "no annotation" (index -1)
+    codes = [labels.code(_get_feature_value(a, feature)) for a in anns] + [0]
+    return array('l', map(codes.__getitem__, ann_idx))
+
+
+def non_punct_counts(doc):
+    '''
+    Return the cumulative numbers of non-punctuation tokens in the flat
+    token array, starting with 0: the number of non-punctuation tokens
+    between the positions `start` and `end` is `counts[end]-counts[start]`.
+    '''
+    return array('l', accumulate(
+        map(ne, map(itemgetter(1), chain.from_iterable(doc)),
+            repeat('PUNCT')),
+        initial=0))
+
+
+def label_segments(spans):
+    '''
+    Convert a list of spans (start, end, label), which may overlap, to
+    a list of non-overlapping segments (start, end, label) sorted by
+    start. Where spans overlap, the later one in the list takes precedence
+    (like in `unfold_annotations()`).
+    '''
+    segments = sorted(spans)
+    if all(a[1] <= b[0] for a, b in zip(segments, segments[1:])):
+        return segments
+    # sweep over the span boundaries, keeping the spans covering the
+    # current position in a heap ordered by their position in the list
+    # (the spans that have ended are removed once they get to the top)
+    points = sorted({p for start, end, label in spans for p in (start, end)})
+    order = sorted(range(len(spans)), key=lambda k: spans[k][0])
+    heap, i, segments = [], 0, []
+    for start, end in zip(points, points[1:]):
+        while i < len(order) and spans[order[i]][0] <= start:
+            heapq.heappush(heap, (-order[i], spans[order[i]][1]))
+            i += 1
+        while heap and heap[0][1] <= start:
+            heapq.heappop(heap)
+        if heap:
+            label = spans[-heap[0][0]][2]
+            if segments and segments[-1][1] == start \
+                    and segments[-1][2] == label:
+                segments[-1] = (segments[-1][0], end, label)
             else:
-                # TODO the annotations exceed sentence boundaries?
-                # TODO raise an exception and print a warning higher in the code
-                if i >= len(results):
-                    break
+                segments.append((start, end, label))
+    return segments
+
+
+def compare_annotations(src_segments, tgt_segments, counts=None):
+    '''
+    Compare two lists of label segments (see `label_segments()`). Returns
+    a Counter of (src, tgt) label pairs with the numbers of tokens, which
+    are labeled so. The tokens not covered by any segment are not counted.
+    If `counts` (see `non_punct_counts()`) is given, only the tokens
+    counted there are included.
+
+    The segments are merged in a single pass, so the time depends only
+    on the number of annotations and not on the length of the document.
+    '''
+    result = Counter()
+    i, j, pos = 0, 0, 0
+    n_src, n_tgt = len(src_segments), len(tgt_segments)
+    while i < n_src or j < n_tgt:
+        # the current label and the next boundary in both lists
+        src_label, src_next = 0, None
+        if i < n_src:
+            start, end, label = src_segments[i]
+            src_label, src_next = (label, end) if start <= pos else (0, start)
+        tgt_label, tgt_next = 0, None
+        if j < n_tgt:
+            start, end, label = tgt_segments[j]
+            tgt_label, tgt_next = (label, end) if start <= pos else (0, start)
+        next_pos = src_next if tgt_next is None \
+                   or (src_next is not None and src_next < tgt_next) \
+                   else tgt_next
+        if src_label or tgt_label:
+            n = next_pos-pos if counts is None \
+                else counts[next_pos]-counts[pos]
+            if n > 0:
+                result[(src_label, tgt_label)] += n
+        pos = next_pos
+        if i < n_src and src_segments[i][1] <= pos:
+            i += 1
+        if j < n_tgt and tgt_segments[j][1] <= pos:
             j += 1
-            if j >= len(results[i]):
-                i += 1
-                j = 0
+    return result
+
+
+def count_results(confusion, labels, tp, fp, fn):
+    '''
+    Add the true positives, false positives and false negatives from
+    a Counter of label pairs to the per-value counters.
+    '''
+    for (src, tgt), n in confusion.items():
+        if src == tgt:
+            if tgt:
+                tp[labels[tgt]] += n
+        else:
+            if src:
+                fp[labels[src]] += n
+            if tgt:
+                fn[labels[tgt]] += n
 
+
+def annotation_spans(offsets, anns, feature, labels):
+    '''
+    Convert the annotations to a list of spans (start, end, label), where
+    start and end are positions in the flat token array (end exclusive).
+    '''
     results = []
-    for s in doc:
-        results.append([None] * len(s))
+    code = labels.code
     for a in anns:
-        _unfold_ann(results, a)
+        start, end = _span_offsets(offsets, a)
+        if start < end:
+            results.append(
+                (start, end, code(True if feature is None else a[feature])))
     return results
 
 
-def compare_annotations(src_anns, tgt_anns, feature=None):
+def _group_spans_by_label(spans):
+    result = defaultdict(lambda: list())
+    for start, end, label in sorted(spans):
+        result[label].append((start, end))
+    return result
 
-    def _get_feature_value(ann, feature):
-        if ann is None:
-            return None
-        elif feature is None:
-            return True
-        else:
-            return ann[feature]
 
-    results = []
-    for sen_src_ann, sen_tgt_ann in zip(src_anns, tgt_anns):
-        sen_results = []
-        for src_ann, tgt_ann in zip(sen_src_ann, sen_tgt_ann):
-            result = {
-                'srcValue': _get_feature_value(src_ann, feature),
-                'tgtValue': _get_feature_value(tgt_ann, feature),
-                'TP': 0, 'FP': 0, 'FN': 0
-            }
-            if result['srcValue'] == result['tgtValue']:
-                result['TP'] = int(result['tgtValue'] is not None)
+def compare_spans_strict(src_spans, tgt_spans):
+    '''
+    Match the spans with exactly the same boundaries and label. Returns
+    a dict label -> (TP, FP, FN).
+    '''
+    src_by_label = _group_spans_by_label(src_spans)
+    tgt_by_label = _group_spans_by_label(tgt_spans)
+    results = {}
+    for label in set(src_by_label) | set(tgt_by_label):
+        src, tgt = src_by_label[label], tgt_by_label[label]
+        # merge the sorted lists -- each span is matched at most once
+        i, j, tp = 0, 0, 0
+        while i < len(src) and j < len(tgt):
+            if src[i] == tgt[j]:
+                tp += 1
+                i += 1
+                j += 1
+            elif src[i] < tgt[j]:
+                i += 1
             else:
-                result['FP'] = int(result['srcValue'] is not None)
-                result['FN'] = int(result['tgtValue'] is not None)
-            sen_results.append(result)
-        results.append(sen_results)
+                j += 1
+        results[label] = (tp, len(src)-tp, len(tgt)-tp)
+    return results
+
+
+def compare_spans_lenient(src_spans, tgt_spans):
+    '''
+    Match the spans with the same label that overlap. Each span is matched
+    at most once: a system span is matched to the earliest starting
+    unmatched gold span overlapping it. Returns a dict label -> (TP, FP, FN).
+    '''
+    src_by_label = _group_spans_by_label(src_spans)
+    tgt_by_label = _group_spans_by_label(tgt_spans)
+    results = {}
+    for label in set(src_by_label) | set(tgt_by_label):
+        src, tgt = src_by_label[label], tgt_by_label[label]
+        # active: unmatched gold spans starting before the end of the
+        # current system span
+        active, j, tp = deque(), 0, 0
+        for start, end in src:
+            while j < len(tgt) and tgt[j][0] < end:
+                active.append(tgt[j])
+                j += 1
+            # the gold spans ending before the current system span can't
+            # match any of the following system spans either
+            while active and active[0][1] <= start:
+                active.popleft()
+            for k, (tgt_start, tgt_end) in enumerate(active):
+                # an earlier, longer system span may have activated gold
+                # spans starting after the end of the current one
+                if tgt_start < end and tgt_end > start:
+                    del active[k]
+                    tp += 1
+                    break
+        results[label] = (tp, len(src)-tp, len(tgt)-tp)
     return results
-        
 
-def print_detailed_results(doc_id, doc, results, print_all=True):
 
-    def _print_sentence_results(s_id, sentence, sen_results):
+def count_span_results(span_results, labels, tp, fp, fn):
+    for label, (n_tp, n_fp, n_fn) in span_results.items():
+        tp[labels[label]] += n_tp
+        fp[labels[label]] += n_fp
+        fn[labels[label]] += n_fn
+
+
+def _token_result(src, tgt):
+    if src == tgt:
+        return 'TP' if tgt else ''
+    else:
+        return '+'.join(([ 'FP' ] if src else []) + ([ 'FN' ] if tgt else []))
+
+
+def print_detailed_results(doc_id, doc, offsets, src_labels, tgt_labels,
+                           labels, print_all=True, fp=sys.stdout):
+
+    def _print_sentence_results(s_id, sentence, sen_src, sen_tgt):
+        results = [_token_result(src, tgt) \
+                   for src, tgt in zip(sen_src, sen_tgt)]
         print('doc_id={} s_id={} TP={} FP={} FN={}'.format(
             doc_id, s_id,
-            sum(r['TP'] for r in sen_results),
-            sum(r['FP'] for r in sen_results),
-            sum(r['FN'] for r in sen_results)))
+            sum(r == 'TP' for r in results),
+            sum('FP' in r for r in results),
+            sum('FN' in r for r in results)), file=fp)
         string = []
-        for (token, r) in zip(sentence, sen_results):
-            label = '+'.join([x for x in ['TP', 'FP', 'FN'] if r[x] > 0])
-            value = r['tgtValue'] if label in ('TP', 'FN') \
-                    else r['srcValue'] if label == 'FP' \
-                    else '{},{}'.format(r['srcValue'], r['tgtValue'])
-            if label:
-                string.append('{}[{},{}]'.format(token['word'], label, value))
+        for token, src, tgt, r in zip(sentence, sen_src, sen_tgt, results):
+            value = labels[tgt] if r in ('TP', 'FN') \
+                    else labels[src] if r == 'FP' \
+                    else '{},{}'.format(labels[src], labels[tgt])
+            if r:
+                string.append('{}[{},{}]'.format(token[0], r, value))
             else:
-                string.append(token['word'])
-        print(' '.join(string))
-        print()
+                string.append(token[0])
+        print(' '.join(string), file=fp)
+        print(file=fp)
 
     for i, s in enumerate(doc):
-        if print_all or any(r['TP']+r['FP']+r['FN'] > 0 for r in results[i]):
-            _print_sentence_results(i+1, s, results[i])
-
-
-def print_csv_results(writer, doc_id, doc, src_ann, tgt_ann, results, \
-                      features, header=False):
-# FIXME adjust to the new format of the results
-    if header:
-        header_row = ['articleId', 'sentenceId', 'wordId', 'word', 'result']
-        for f in features:
-            header_row.append('src'+f[0].upper()+f[1:])
-            header_row.append('tgt'+f[0].upper()+f[1:])
-        writer.writerow(header_row)
-    for i, (sen, sen_src_ann, sen_tgt_ann, sen_res) in \
-            enumerate(zip(doc, src_ann, tgt_ann, results)):
-        for j, (tok, src_ann, tgt_ann, res) in \
-                enumerate(zip(sen, sen_src_ann, sen_tgt_ann, sen_res)):
-            if res is not None:
-                row = [doc_id, i+1, j+1, tok['word'], res]
-                for f in features:
-                    row.append(src_ann[f] if src_ann is not None else 'NA')
-                    row.append(tgt_ann[f] if tgt_ann is not None else 'NA')
-                writer.writerow(row)
+        sen_src = src_labels[offsets[i]:offsets[i+1]]
+        sen_tgt = tgt_labels[offsets[i]:offsets[i+1]]
+        if print_all or any(src or tgt for src, tgt in zip(sen_src, sen_tgt)):
+            _print_sentence_results(i+1, s, sen_src, sen_tgt)
+
+
+def print_csv_header(writer, features):
+    header_row = ['articleId', 'sentenceId', 'wordId', 'word', 'result']
+    for f in features:
+        header_row.append('src'+f[0].upper()+f[1:])
+        header_row.append('tgt'+f[0].upper()+f[1:])
+    writer.writerow(header_row)
+
+
+def print_csv_results(writer, doc_id, doc, offsets, src_idx, tgt_idx,
+                      src_anns, tgt_anns, src_labels, tgt_labels,
+                      features):
+    for i, sen in enumerate(doc):
+        for j, tok in enumerate(sen):
+            k = offsets[i]+j
+            src_ann = src_anns[src_idx[k]] if src_idx[k] > -1 else None
+            tgt_ann = tgt_anns[tgt_idx[k]] if tgt_idx[k] > -1 else None
+            row = [doc_id, i+1, j+1, tok[0],
+                   _token_result(src_labels[k], tgt_labels[k])]
+            for f in features:
+                row.append(src_ann[f] if src_ann is not None else 'NA')
+                row.append(tgt_ann[f] if tgt_ann is not None else 'NA')
+            writer.writerow(row)
 
 
 def parse_arguments():
     parser = argparse.ArgumentParser(
         description='Compare annotations to a gold standard.')
     parser.add_argument(
-        '-i', '--input-file', metavar='FILE',
-        help='input file')
+        '-i', '--input-file', metavar='FILE', nargs='+',
+        help='input file(s) -- several files (e.g. outputs of different'
+             ' systems) can be evaluated against the same gold standard')
     parser.add_argument(
         '-g', '--gs-file', metavar='FILE',
         help='gold standard file')
@@ -196,56 +520,342 @@ def parse_arguments():
         '-c', '--corpus-file',
         help='corpus file')
     parser.add_argument(
-        '-f', '--feature', metavar='FEATURE',
-        help='Evaluate classes separately according to the feature.')
+        '-f', '--feature', metavar='FEATURE', nargs='+', default=[None],
+        help='Evaluate classes separately according to the feature.'
+             ' If several features are given, each is evaluated'
+             ' separately.')
     parser.add_argument(
         '-r', '--results-format',
-        choices=['short', 'long', 'csv'], default='long')
+        choices=['short', 'long', 'csv'],
+        help='default: "long" for a single input file and feature,'
+             ' "short" otherwise')
     parser.add_argument(
         '--exclude-punct', action='store_true',
         help='Exclude punctuation marks from evaluation metrics.')
+    parser.add_argument(
+        '-s', '--span-eval', nargs='+', choices=['strict', 'lenient'],
+        default=[],
+        help='Additionally evaluate whole spans: "strict" requires exact'
+             ' boundaries, "lenient" any overlap.')
+    parser.add_argument(
+        '--bootstrap', type=int, default=0, metavar='N',
+        help='Compute confidence intervals of the micro-averaged scores'
+             ' from N bootstrap resamples of the documents.')
+    parser.add_argument(
+        '--significance', type=int, default=0, metavar='N',
+        help='Compare each input file to the first one with a paired'
+             ' approximate randomization test with N iterations.')
+    parser.add_argument(
+        '--confidence', type=float, default=0.95,
+        help='The confidence level for --bootstrap (default: 0.95).')
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help='The random seed for --bootstrap and --significance.')
+    parser.add_argument(
+        '--sorted', action='store_true',
+        help='The input files are sorted lexicographically by articleId'
+             ' (as strings, e.g. with `LC_ALL=C sort`, not numerically):'
+             ' stream them instead of loading them into memory.')
+    add_profiling_arguments(parser)
     return parser.parse_args()
 
 
-def main():
-    args = parse_arguments()
-    gs_anns, gs_ann_feats = load_annotations(args.gs_file)
+def check_arguments(args):
+    multiple = len(args.input_file) > 1 or len(args.feature) > 1
+    if args.results_format is None:
+        args.results_format = 'short' if multiple else 'long'
+    if args.results_format in ('long', 'csv') and multiple:
+        raise RuntimeError(
+            'Results format \'{}\' is only possible for a single input'
+            ' file and feature.'.format(args.results_format))
+
+
+def load_documents(gs_file, input_files, corpus_file):
+    '''
+    Load the gold standard, the annotations to evaluate and the corpus into
+    memory. Returns a generator of tuples:
+      (doc_id, doc, [input_anns for each input file], gs_anns)
+    sorted by doc_id and the tuple of features common to all annotations.
+    '''
+    gs_anns, features = load_annotations(gs_file)
+    features = set(features)
     doc_ids = set(gs_anns.keys())
-    input_anns, input_ann_feats = \
-        load_annotations(args.input_file, only_doc_ids=doc_ids)
-    features = tuple(sorted(list(set(input_ann_feats) & set(gs_ann_feats))))
-    corpus = None
-    corpus = load_corpus(args.corpus_file, only_doc_ids=doc_ids)
-    tp, fp, fn = defaultdict(lambda: 0), defaultdict(lambda: 0), defaultdict(lambda: 0)
-    writer = csv.writer(sys.stdout, lineterminator='\n') \
-             if args.results_format == 'csv' else None
-    first = True
-    for doc_id in sorted(doc_ids):
-        doc_src_anns = unfold_annotations(corpus[doc_id], input_anns[doc_id])
-        doc_tgt_anns = unfold_annotations(corpus[doc_id], gs_anns[doc_id])
-        results = compare_annotations(doc_src_anns, doc_tgt_anns, feature=args.feature)
-        if args.results_format == 'long':
-            print_detailed_results(doc_id, corpus[doc_id], results)
-        elif args.results_format == 'csv':
-            print_csv_results(
-                writer, doc_id, corpus[doc_id], doc_src_anns, doc_tgt_anns,
-                results, features, first)
-            first = False
-        for i, sen_results in enumerate(results):
-            for j, r in enumerate(sen_results):
-                if not args.exclude_punct or corpus[doc_id][i][j]['upos'] != 'PUNCT':
-                    if r['srcValue'] is not None:
-                        fp[r['srcValue']] += r['FP']
-                    if r['tgtValue'] is not None:
-                        tp[r['tgtValue']] += r['TP']
-                        fn[r['tgtValue']] += r['FN']
-    if args.results_format in ['short', 'long']:
-        keys = set(tp.keys()) | set(fp.keys()) | set(fn.keys())
-        for key in keys:
-            pre = tp[key] / (tp[key] + fp[key]) \
-                  if (tp[key] + fp[key]) > 0 else 0
-            rec = tp[key] / (tp[key] + fn[key]) \
-                  if (tp[key] + fn[key]) > 0 else 0
-            fsc = 2 / (1/pre + 1/rec) if pre*rec > 0 else 0
+    input_anns = []
+    for input_file in input_files:
+        anns, input_ann_feats = \
+            load_annotations(input_file, only_doc_ids=doc_ids)
+        input_anns.append(anns)
+        features &= set(input_ann_feats)
+    corpus = load_corpus(corpus_file, only_doc_ids=doc_ids)
+    documents = ((doc_id, corpus[doc_id], [anns[doc_id] for anns in input_anns],
+                  gs_anns[doc_id]) \
+                 for doc_id in sorted(doc_ids))
+    return documents, tuple(sorted(features))
+
+
+def stream_documents(gs_fp, input_fps, corpus_fp):
+    '''
+    Like load_documents(), but stream the files (which have to be sorted
+    by articleId) in parallel with a merge-join, so that only the current
+    document is kept in memory.
+    '''
+
+    def _join(gs_docs, input_docs, corpus_docs):
+        input_streams = [_SortedDocStream(docs, 'Input file') \
+                         for docs in input_docs]
+        corpus_stream = _SortedDocStream(corpus_docs, 'Corpus file')
+        gs_stream = _SortedDocStream(gs_docs, 'Gold standard file')
+        for doc_id, gs_anns in gs_stream:
+            yield doc_id, corpus_stream.get(doc_id, []), \
+                  [stream.get(doc_id, []) for stream in input_streams], \
+                  gs_anns
+
+    gs_docs, features = iter_annotations(gs_fp)
+    features = set(features)
+    input_docs = []
+    for input_fp in input_fps:
+        docs, input_ann_feats = iter_annotations(input_fp)
+        input_docs.append(docs)
+        features &= set(input_ann_feats)
+    return _join(gs_docs, input_docs, iter_corpus(corpus_fp)), \
+           tuple(sorted(features))
+
+
+def _prf(tp, fp, fn):
+    pre = tp / (tp + fp) if (tp + fp) > 0 else 0
+    rec = tp / (tp + fn) if (tp + fn) > 0 else 0
+    fsc = 2 / (1/pre + 1/rec) if pre*rec > 0 else 0
+    return pre, rec, fsc
+
+
+def _percentile(values, q):
+    return values[min(int(q * len(values)), len(values)-1)]
+
+
+def bootstrap_ci(doc_counts, n_resamples, confidence, rng):
+    '''
+    Compute bootstrap confidence intervals for the micro-averaged
+    precision, recall and F-score. `doc_counts` is a triple of arrays
+    containing the TP, FP and FN counts of each document. Returns a list
+    of triples (value, lower, upper) for precision, recall and F-score.
+    '''
+    tp, fp, fn = doc_counts
+    n = len(tp)
+    population = range(n)
+    samples = ([], [], [])
+    for r in range(n_resamples):
+        idx = rng.choices(population, k=n)
+        values = _prf(sum(map(tp.__getitem__, idx)),
+                      sum(map(fp.__getitem__, idx)),
+                      sum(map(fn.__getitem__, idx)))
+        for sample, value in zip(samples, values):
+            sample.append(value)
+    alpha = (1-confidence) / 2
+    results = []
+    for value, sample in zip(_prf(sum(tp), sum(fp), sum(fn)), samples):
+        sample.sort()
+        results.append(
+            (value, _percentile(sample, alpha), _percentile(sample, 1-alpha)))
+    return results
+
+
+# maps a random byte to a random bit
+_RANDOM_BIT_TABLE = bytes(i & 1 for i in range(256))
+
+
+def approximate_randomization(doc_counts_a, doc_counts_b, n_iter, rng):
+    '''
+    Paired approximate randomization test for the difference of the
+    micro-averaged F-scores of two systems. The per-document counts of
+    the systems are swapped in randomly chosen documents. Returns the
+    observed difference F(b)-F(a) and the p-value.
+    '''
+    totals_a = tuple(map(sum, doc_counts_a))
+    totals_b = tuple(map(sum, doc_counts_b))
+    observed = _prf(*totals_b)[2] - _prf(*totals_a)[2]
+    # the differences of counts in each document
+    deltas = tuple(array('l', map(int.__sub__, b, a)) \
+                   for a, b in zip(doc_counts_a, doc_counts_b))
+    n, k = len(deltas[0]), 0
+    for r in range(n_iter):
+        swap = rng.randbytes(n).translate(_RANDOM_BIT_TABLE)
+        shift = tuple(sum(compress(d, swap)) for d in deltas)
+        diff = _prf(*map(int.__sub__, totals_b, shift))[2] \
+               - _prf(*map(int.__add__, totals_a, shift))[2]
+        if abs(diff) >= abs(observed):
+            k += 1
+    return observed, (k+1) / (n_iter+1)
+
+
+def print_scores(tp, fp, fn, prefix=None):
+    keys = set(tp.keys()) | set(fp.keys()) | set(fn.keys())
+    for key in sorted(keys, key=str):
+        pre, rec, fsc = _prf(tp[key], fp[key], fn[key])
+        if prefix is not None:
+            print(prefix, key, tp[key], fp[key], fn[key], pre, rec, fsc)
+        else:
             print(key, tp[key], fp[key], fn[key], pre, rec, fsc)
 
+
+SPAN_COMPARISON_FUNCTIONS = {
+    'strict' : compare_spans_strict,
+    'lenient' : compare_spans_lenient
+}
+
+EvalOptions = namedtuple(
+    'EvalOptions',
+    ('n_inputs', 'eval_features', 'features', 'results_format',
+     'exclude_punct', 'span_eval'))
+
+
+def _new_counts(options):
+    '''
+    Create the counters for the evaluation results: a dict mapping
+    (input_idx, feature, mode) to a triple of Counters (TP, FP, FN)
+    indexed by feature values. `mode` is 'token' or one of the span
+    evaluation modes.
+    '''
+    return { (i, feature, mode): (Counter(), Counter(), Counter()) \
+             for i in range(options.n_inputs) \
+             for feature in options.eval_features \
+             for mode in ('token',) + tuple(options.span_eval) }
+
+
+def _add_counts(counts, other):
+    for key, values in other.items():
+        for c1, c2 in zip(counts[key], values):
+            c1.update(c2)
+
+
+def evaluate_document(options, document):
+    '''
+    Evaluate a single document, which is a tuple:
+    (doc_id, doc, [input_anns for each input file], gs_anns).
+    Returns the counts (see _new_counts()) and the detailed output
+    (depending on the results format) as a string.
+
+    The token-level results are computed from the label segments (see
+    `compare_annotations()`). The per-token arrays of labels are only
+    created if the detailed output is needed. The gold standard
+    annotations are processed only once and reused for all input files.
+    '''
+    doc_id, doc, inputs_anns, gs_anns = document
+    labels = LabelIndex()
+    counts = _new_counts(options)
+    output = io.StringIO()
+    offsets = sentence_offsets(doc)
+    token_counts = non_punct_counts(doc) if options.exclude_punct else None
+    detailed = options.results_format in ('long', 'csv')
+    if detailed:
+        tgt_idx = unfold_annotations(offsets, gs_anns)
+    for feature in options.eval_features:
+        tgt_spans = annotation_spans(offsets, gs_anns, feature, labels)
+        tgt_segments = label_segments(tgt_spans)
+        if detailed:
+            tgt_labels = label_annotations(tgt_idx, gs_anns, feature, labels)
+        for i, input_anns in enumerate(inputs_anns):
+            src_spans = annotation_spans(offsets, input_anns, feature, labels)
+            if detailed:
+                src_idx = unfold_annotations(offsets, input_anns)
+                src_labels = label_annotations(
+                    src_idx, input_anns, feature, labels)
+            if options.results_format == 'long':
+                print_detailed_results(
+                    doc_id, doc, offsets, src_labels, tgt_labels, labels,
+                    fp=output)
+            elif options.results_format == 'csv':
+                print_csv_results(
+                    csv.writer(output, lineterminator='\n'), doc_id, doc,
+                    offsets, src_idx, tgt_idx, input_anns, gs_anns,
+                    src_labels, tgt_labels, options.features)
+            confusion = compare_annotations(
+                label_segments(src_spans), tgt_segments, token_counts)
+            count_results(confusion, labels, *counts[(i, feature, 'token')])
+            for mode in options.span_eval:
+                count_span_results(
+                    SPAN_COMPARISON_FUNCTIONS[mode](src_spans, tgt_spans),
+                    labels, *counts[(i, feature, mode)])
+    return counts, output.getvalue()
+
+
+def _results_prefix(args, i, feature, mode):
+    return ' '.join((args.input_file[i], feature or '-', mode))
+
+
+def print_bootstrap_results(args, doc_counts):
+    '''
+    Print the bootstrap confidence intervals of the micro-averaged
+    precision, recall and F-score for each input file, feature and mode.
+    '''
+    rng = random.Random(args.seed)
+    for (i, feature, mode), values in doc_counts.items():
+        results = bootstrap_ci(values, args.bootstrap, args.confidence, rng)
+        print('CI', _results_prefix(args, i, feature, mode),
+              *(x for r in results for x in r))
+
+
+def print_significance_results(args, doc_counts):
+    '''
+    Print the difference of the micro-averaged F-scores between each input
+    file and the first one, together with the p-value.
+    '''
+    rng = random.Random(args.seed)
+    for (i, feature, mode), values in doc_counts.items():
+        if i > 0:
+            diff, p_value = approximate_randomization(
+                doc_counts[(0, feature, mode)], values, args.significance,
+                rng)
+            print('AR', args.input_file[0],
+                  _results_prefix(args, i, feature, mode), diff, p_value)
+
+
+@profiled
+def main():
+    args = parse_arguments()
+    check_arguments(args)
+    with ExitStack() as stack:
+        if args.sorted:
+            documents, features = stream_documents(
+                stack.enter_context(open(args.gs_file)),
+                [stack.enter_context(open(f)) for f in args.input_file],
+                stack.enter_context(open(args.corpus_file)))
+        else:
+            documents, features = load_documents(
+                args.gs_file, args.input_file, args.corpus_file)
+        options = EvalOptions(
+            len(args.input_file), args.feature, features,
+            args.results_format, args.exclude_punct, args.span_eval)
+        counts = _new_counts(options)
+        # per-document micro-averaged counts: key -> (TP, FP, FN) arrays
+        doc_counts = { key: (array('l'), array('l'), array('l')) \
+                       for key in counts } \
+                     if args.bootstrap or args.significance else None
+        if args.results_format == 'csv':
+            print_csv_header(csv.writer(sys.stdout, lineterminator='\n'),
+                             features)
+        for document in documents:
+            cur_counts, output = evaluate_document(options, document)
+            _add_counts(counts, cur_counts)
+            if doc_counts is not None:
+                for key, values in cur_counts.items():
+                    for a, c in zip(doc_counts[key], values):
+                        a.append(sum(c.values()))
+            sys.stdout.write(output)
+    if args.results_format in ['short', 'long']:
+        if len(args.input_file) == 1 and len(args.feature) == 1:
+            print_scores(*counts[(0, args.feature[0], 'token')])
+            for mode in args.span_eval:
+                print_scores(*counts[(0, args.feature[0], mode)], prefix=mode)
+        else:
+            # print a table of results keyed by input file and feature
+            for i, input_file in enumerate(args.input_file):
+                for feature in args.feature:
+                    for mode in ('token',) + tuple(args.span_eval):
+                        print_scores(
+                            *counts[(i, feature, mode)],
+                            prefix=' '.join((input_file,
+                                             feature or '-', mode)))
+    if args.bootstrap:
+        print_bootstrap_results(args, doc_counts)
+    if args.significance:
+        print_significance_results(args, doc_counts)
@@ -1,11 +1,17 @@
 import argparse
+from contextlib import ExitStack
 import csv
+import functools
+import multiprocessing
 import os
 import os.path
 import sys
+import zipfile
 
 from flopo_formats.data import Corpus
+from flopo_formats.io.generic import _get_filenames, read_webanno_zip
 from flopo_formats.io.webannotsv import load_webanno_tsv
+from flopo_formats.profiling import add_profiling_arguments, profiled
 
 
 def export_document(doc, writer, doc_id, layer, header=False):
@@ -27,6 +33,50 @@ def export_document(doc, writer, doc_id, layer, header=False):
         writer.writerow(row)
 
 
+# the placeholder for the layer name in the output file name
+LAYER_PLACEHOLDER = '{layer}'
+CHUNKSIZE = 16
+
+
+def read_input_dir(input_dir, jobs=1, layers=None, include=None,
+                   exclude=None):
+    '''
+    Read the WebAnno-TSV documents from a directory (recursively, in
+    alphabetical order). Yields pairs: (doc_id, doc). `include` and
+    `exclude` are lists of glob patterns filtering the files (see
+    `_get_filenames()`). If `jobs` > 1, the documents are parsed in
+    parallel processes (but returned in the same order). If `layers` is
+    given, only these annotation layers are read.
+    '''
+    paths = list(_get_filenames(input_dir, recursive=True, include=include,
+                                exclude=exclude))
+    doc_ids = [os.path.basename(path).replace('.tsv', '') for path in paths]
+    if jobs > 1:
+        with multiprocessing.Pool(jobs) as pool:
+            yield from zip(doc_ids, pool.imap(
+                functools.partial(load_webanno_tsv, layers=layers), paths,
+                chunksize=CHUNKSIZE))
+    else:
+        for doc_id, path in zip(doc_ids, paths):
+            yield doc_id, load_webanno_tsv(path, layers)
+
+
+def open_output_files(stack, output_file, layers):
+    '''
+    Open an output file for each layer and register it in `stack` (an
+    ExitStack). Returns a dict: layer -> file object.
+    '''
+    if output_file is None or output_file == '-':
+        return { layer: sys.stdout for layer in layers }
+    elif LAYER_PLACEHOLDER in output_file:
+        return { layer: stack.enter_context(open(
+                     output_file.replace(LAYER_PLACEHOLDER, layer), 'w+')) \
+                 for layer in layers }
+    else:
+        fp = stack.enter_context(open(output_file, 'w+'))
+        return { layer: fp for layer in layers }
+
+
 def parse_arguments():
     parser = argparse.ArgumentParser(
         description='Export the annotations from a given layer as text'\
@@ -36,13 +86,29 @@ def parse_arguments():
         help='A WebAnno-TSV document.')
     parser.add_argument(
         '-I', '--input-dir', metavar='DIR',
-        help='A directory containing WebAnno-TSV documents.')
+        help='A directory or a zip file (e.g. an exported WebAnno project)'\
+             ' containing WebAnno-TSV documents.')
+    parser.add_argument(
+        '--include', nargs='+', metavar='PATTERN',
+        help='If reading from a directory or a zip file, read only the'\
+             ' files or entries matching one of the glob patterns (default'\
+             ' for zip files: source/*), e.g. \'curation/*/*.tsv\'.')
+    parser.add_argument(
+        '--exclude', nargs='+', metavar='PATTERN',
+        help='If reading from a directory or a zip file, skip the files'\
+             ' or entries matching one of the glob patterns.')
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=1,
+        help='If reading from a directory or a zip file, the number of'\
+             ' processes parsing the documents in parallel.')
     parser.add_argument(
         '-o', '--output-file', metavar='FILE', default='-',
-        help='Output CSV file - if none given, the standard output is used.')
+        help='Output CSV file - if none given, the standard output is used.'\
+             ' If exporting several layers, \'{layer}\' in the file name'\
+             ' is replaced with the layer name, e.g. \'export-{layer}.csv\'.')
     parser.add_argument(
-        '-a', '--annotation', metavar='LAYER',
-        help='The annotation layer to export.')
+        '-a', '--annotation', metavar='LAYER', nargs='+',
+        help='The annotation layer(s) to export.')
     parser.add_argument(
         '-d', '--delimiter', default=',',
         help='Delimiter to separate the fields.')
@@ -50,30 +116,55 @@ def parse_arguments():
         '--doc-id',
         help='ID of the current document (default: filename '\
              'without \'.tsv\' suffix).')
+    add_profiling_arguments(parser)
     return parser.parse_args()
 
 
+def check_arguments(args):
+    'Check the validity of the command-line argument combination.'
+    if not args.annotation:
+        raise RuntimeError('No annotation layer supplied (use -a option).')
+    if len(args.annotation) > 1 and (
+            args.output_file is None or args.output_file == '-' \
+            or LAYER_PLACEHOLDER not in args.output_file):
+        raise RuntimeError(
+            'Exporting several layers requires an output file name'
+            ' containing {} (use -o option).'.format(LAYER_PLACEHOLDER))
+
+
+@profiled
 def main():
     args = parse_arguments()
-    first = True
-    outfp = sys.stdout
-    if args.output_file is not None and args.output_file != '-':
-        outfp = open(args.output_file, 'w+')
-    writer = csv.writer(outfp, delimiter=args.delimiter, lineterminator='\n')
-    if args.input_file is not None:
-        doc = load_webanno_tsv(args.input_file)
-        doc_id = args.doc_id
-        if doc_id is None:
-            doc_id = os.path.basename(args.input_file).replace('.tsv', '')
-        export_document(doc, writer, doc_id, args.annotation, header=first)
-        first = False
-    if args.input_dir is not None:
-        for dirpath, dirnames, filenames in os.walk(args.input_dir):
-            for f in filenames:
-                doc_id = f.replace('.tsv', '')
-                doc = load_webanno_tsv(os.path.join(dirpath, f))
-                export_document(doc, writer, doc_id, args.annotation,
-                                header=first)
-                first = False
-    outfp.close()
+    check_arguments(args)
+    first = { layer: True for layer in args.annotation }
+    # parse only the columns of the exported layers
+    layers = set(args.annotation)
+
+    def _export(doc, doc_id):
+        for layer in args.annotation:
+            export_document(doc, writers[layer], doc_id, layer,
+                            header=first[layer])
+            first[layer] = False
 
+    with ExitStack() as stack:
+        writers = {
+            layer: csv.writer(fp, delimiter=args.delimiter,
+                              lineterminator='\n') \
+            for layer, fp in open_output_files(
+                stack, args.output_file, args.annotation).items() }
+        if args.input_file is not None:
+            doc = load_webanno_tsv(args.input_file, layers)
+            doc_id = args.doc_id
+            if doc_id is None:
+                doc_id = os.path.basename(args.input_file).replace('.tsv', '')
+            _export(doc, doc_id)
+        if args.input_dir is not None and os.path.isfile(args.input_dir) \
+                and zipfile.is_zipfile(args.input_dir):
+            for doc in read_webanno_zip(args.input_dir, args.include,
+                                        args.exclude, args.jobs, layers):
+                _export(doc, doc.doc_id)
+        elif args.input_dir is not None:
+            for doc_id, doc in read_input_dir(
+                    args.input_dir, args.jobs, layers, args.include,
+                    args.exclude):
+                _export(doc, doc_id)
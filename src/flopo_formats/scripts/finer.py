@@ -1,20 +1,86 @@
 import argparse
+from contextlib import ExitStack
 import csv
+import functools
 import logging
+import os
+import os.path
 
 #from flopo_formats.io.csv import load_csv
 from flopo_formats.io.generic import read_docs
+from flopo_formats.profiling import add_profiling_arguments, profiled
+from flopo_formats.wrappers.adaptive import \
+    AdaptiveController, DEFAULT_RETRY_BUDGET
+from flopo_formats.wrappers.cache import \
+    annotate_docs_cached, DEFAULT_CACHE_SIZE, SentenceCache
+from flopo_formats.wrappers.dedup import \
+    annotate_docs_deduplicated, DEFAULT_MEMORY_BUDGET, FingerprintStore
 import flopo_formats.wrappers.finer
 
 
-def write_annotations(annotations, output_file):
-    with open(output_file, 'w+') as fp:
+CHECKPOINT_SUFFIX = '.done'
+
+
+def load_checkpoint(output_file):
+    '''
+    Read the checkpoint file of `output_file`. Returns the set of IDs of
+    completed documents and the size of the output file after the last
+    completed document (or None if there is no checkpoint).
+    '''
+    done, offset = set(), None
+    checkpoint_file = output_file + CHECKPOINT_SUFFIX
+    if os.path.exists(checkpoint_file) and os.path.exists(output_file):
+        with open(checkpoint_file) as fp:
+            for line in fp:
+                # ignore an incomplete last line
+                if not line.endswith('\n'):
+                    break
+                doc_id, offset = line.rstrip('\n').split('\t')
+                done.add(doc_id)
+        if offset is not None:
+            offset = int(offset)
+    return done, offset
+
+
+def write_annotations(annotations, output_file, offset=None):
+    '''
+    Write the annotations to a CSV file as the documents are completed.
+    After each document, its ID and the size of the output file are
+    appended to the checkpoint file. If `offset` is given, the output
+    file is truncated to this size and appended to, otherwise it is
+    overwritten.
+    '''
+    checkpoint_file = output_file + CHECKPOINT_SUFFIX
+    if offset is not None:
+        # drop the output of a document that wasn't completed
+        # and an incomplete last line of the checkpoint
+        os.truncate(output_file, offset)
+        with open(checkpoint_file, 'rb+') as cp:
+            cp.truncate(cp.read().rfind(b'\n')+1)
+    with open(output_file, 'a' if offset is not None else 'w+') as fp, \
+            open(checkpoint_file, 'a' if offset is not None else 'w+') as cp:
         writer = csv.writer(fp, lineterminator='\n')
-        writer.writerow(
-            ('articleId', 'sentenceId', 'startWordId', 'endWordId', 'value'))
+        if offset is None:
+            writer.writerow(
+                ('articleId', 'sentenceId', 'startWordId', 'endWordId',
+                 'value'))
         for doc_id, doc_anns in annotations:
             for s_id, start_idx, end_idx, ann_type in doc_anns:
                 writer.writerow((doc_id, s_id, start_idx, end_idx, ann_type))
+            fp.flush()
+            cp.write('{}\t{}\n'.format(doc_id, fp.tell()))
+            cp.flush()
+
+
+def _log_progress(docs):
+    for i, (doc_id, sentences) in enumerate(docs, 1):
+        logging.info('Processing document: {} ({})'.format(doc_id, i))
+        yield doc_id, sentences
+
+
+def _annotate_docs(docs):
+    for doc_id, sentences in docs:
+        yield doc_id, flopo_formats.wrappers.finer.annotate(sentences)
 
 
 def parse_arguments():
@@ -26,28 +92,112 @@ def parse_arguments():
     parser.add_argument(
         '-o', '--output-file', metavar='FILE',
         help='CSV file to save FINER annotations.')
+    parser.add_argument(
+        '--resume', action='store_true',
+        help='Resume an interrupted run: skip the documents that are'\
+             ' already present in the output file (according to its'\
+             ' checkpoint file) and append to it.')
     parser.add_argument(
         '--remote', action='store_true',
         help='Use a remote FINER instance via POST requests.')
+    parser.add_argument(
+        '--remote-url', metavar='URL',
+        default=flopo_formats.wrappers.finer.REMOTE_FINER_URL,
+        help='URL of the remote FINER instance.')
+    parser.add_argument(
+        '--batch-size', type=int,
+        default=flopo_formats.wrappers.finer.DEFAULT_BATCH_SIZE,
+        help='Number of documents to send to the remote FINER in a single'\
+             ' request.')
+    parser.add_argument(
+        '--request-timeout', type=float,
+        default=flopo_formats.wrappers.finer.DEFAULT_REQUEST_TIMEOUT,
+        help='Timeout (in seconds) of a request to the remote FINER.')
+    parser.add_argument(
+        '--retry-budget', type=int, default=DEFAULT_RETRY_BUDGET,
+        help='Maximum total number of retried requests to the remote FINER'\
+             ' before giving up.')
+    parser.add_argument(
+        '--persistent', action='store_true',
+        help='Keep a single local FINER process running for all documents'\
+             ' instead of starting a new one for each document.')
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=1,
+        help='Number of local FINER processes to run in parallel'\
+             ' (implies --persistent), or with --remote: the number of'\
+             ' concurrent requests.')
+    parser.add_argument(
+        '--cache', metavar='FILE',
+        help='Cache the results for single sentences in an SQLite database'\
+             ' FILE and tag only the sentences missing from the cache.')
+    parser.add_argument(
+        '--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+        help='Maximum number of sentences in the cache (the least recently'\
+             ' used ones are evicted).')
+    parser.add_argument(
+        '--tagger-version', default='',
+        help='Version of the tagger. If the cache was created with a'\
+             ' different version, it is cleared.')
+    parser.add_argument(
+        '--dedup', action='store_true',
+        help='Tag each distinct sentence of the corpus only once.')
+    parser.add_argument(
+        '--dedup-memory', type=int, default=DEFAULT_MEMORY_BUDGET,
+        metavar='MB',
+        help='Memory budget (in MiB) for remembering the sentences seen'\
+             ' in --dedup mode.')
     parser.add_argument(\
         '-L', '--logging', default='WARNING',
         choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
         help='logging level')
+    add_profiling_arguments(parser)
     return parser.parse_args()
 
 
+@profiled
 def main():
     args = parse_arguments()
     logging.basicConfig(
         level=args.logging,
         format='%(asctime)s - %(levelname)s - %(message)s',
         datefmt='%Y-%m-%d %H:%M')
-    annotations = []
-    for i, doc in enumerate(read_docs(args.input_file, 'csv', False), 1):
-        sentences = [[t.string for t in s.tokens] for s in doc.sentences]
-        annotations.append((
-            doc.doc_id,
-            flopo_formats.wrappers.finer.annotate(sentences, args.remote)))
-        logging.info('Processing document: {} ({})'.format(doc.doc_id, i))
-    write_annotations(annotations, args.output_file)
+    done, offset = set(), None
+    if args.resume:
+        done, offset = load_checkpoint(args.output_file)
+        logging.info('Resuming: skipping {} completed documents.'\
+                     .format(len(done)))
+    docs = ((doc.doc_id,
+             [[t.string for t in s.tokens] for s in doc.sentences]) \
+            for doc in read_docs(args.input_file, 'csv', False) \
+            if doc.doc_id not in done)
+    with ExitStack() as stack:
+        if args.remote:
+            annotate_docs = stack.enter_context(
+                flopo_formats.wrappers.finer.RemoteFiner(
+                    url=args.remote_url, batch_size=args.batch_size,
+                    max_requests=args.jobs, timeout=args.request_timeout,
+                    controller=AdaptiveController(
+                        args.jobs, retry_budget=args.retry_budget)))\
+                .annotate_docs
+        elif args.persistent or args.jobs > 1:
+            annotate_docs = stack.enter_context(
+                flopo_formats.wrappers.finer.FinerPool(args.jobs))\
+                .annotate_docs
+        else:
+            annotate_docs = _annotate_docs
+        if args.cache is not None:
+            cache = stack.enter_context(SentenceCache(
+                args.cache, max_size=args.cache_size,
+                tagger_version=args.tagger_version))
+            annotate_docs = functools.partial(
+                annotate_docs_cached, annotate_docs=annotate_docs, cache=cache)
+        if args.dedup:
+            store = FingerprintStore(args.dedup_memory)
+            annotate_docs = functools.partial(
+                annotate_docs_deduplicated, annotate_docs=annotate_docs,
+                store=store)
+        write_annotations(
+            annotate_docs(_log_progress(docs)), args.output_file, offset)
+        if args.dedup:
+            store.log_statistics()
 
@@ -1,39 +1,166 @@
 import argparse
-import json
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import logging
+import math
+import os
 import os.path
 from pathlib import Path
-from zipfile import ZipFile, ZIP_DEFLATED
-
-
-def load_template(template_file):
-    template = None
-    with open(template_file) as fp:
-        template = json.load(fp)
-    return template
-
-
-def package(corpus_dir, name, template, output_file=None):
-    sourceTemplate = json.loads('''{
-        "name" : null,
-        "format" : "ctsv3",
-        "state" : "NEW",
-        "timestamp" : null,
-        "sentence_accessed" : 0,
-        "created" : null,
-        "updated" : null
-      }''')
+import threading
+import time
+from zipfile import ZipFile
+
+from flopo_formats.io.generic import MANIFEST_FILENAME
+from flopo_formats.io.webannoproject import \
+    compress_files, DEFAULT_COMPRESSION_LEVEL, load_template, \
+    WebAnnoProjectWriter
+from flopo_formats.profiling import add_profiling_arguments, profiled
+
+
+PROGRESS_INTERVAL = 10
+
+
+class _Progress:
+    'Log the number of files and bytes processed per second.'
+
+    def __init__(self, interval=PROGRESS_INTERVAL):
+        self.files = 0
+        self.bytes = 0
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.start = self.last = time.perf_counter()
+
+    def update(self, size):
+        with self.lock:
+            self.files += 1
+            self.bytes += size
+            now = time.perf_counter()
+            if now - self.last >= self.interval:
+                self.last = now
+                self.log()
+
+    def log(self):
+        elapsed = time.perf_counter() - self.start
+        logging.info(
+            'Packaged {} files, {:.1f} MB ({:.1f} files/s, {:.1f} MB/s)'\
+            .format(self.files, self.bytes / 1e6,
+                    self.files / elapsed if elapsed > 0 else 0,
+                    self.bytes / 1e6 / elapsed if elapsed > 0 else 0))
+
+
+def split_into_parts(sizes, max_docs=None, max_bytes=None):
+    '''
+    Split files with the given sizes into the smallest number of parts
+    having max. `max_docs` files and `max_bytes` bytes (unless a single
+    file is larger), with total sizes as balanced as possible. Uses greedy
+    bin packing: the files are assigned from the largest to the part with
+    the smallest total size. Returns a list of lists of file indices.
+    '''
+    n = 1
+    if max_docs is not None:
+        n = max(n, math.ceil(len(sizes) / max_docs))
+    if max_bytes is not None:
+        n = max(n, math.ceil(sum(sizes) / max_bytes))
+    while True:
+        parts = [[] for i in range(n)]
+        totals = [0] * n
+        heap = [(0, i) for i in range(n)]
+        for j in sorted(range(len(sizes)), key=lambda j: -sizes[j]):
+            total, i = heapq.heappop(heap)
+            parts[i].append(j)
+            totals[i] += sizes[j]
+            if max_docs is None or len(parts[i]) < max_docs:
+                heapq.heappush(heap, (totals[i], i))
+        if max_bytes is None or n >= len(sizes) \
+                or all(t <= max_bytes or len(p) <= 1 \
+                       for p, t in zip(parts, totals)):
+            return [sorted(p) for p in parts if p]
+        n += 1
+
+
+def _package_part(paths, name, template, output_file, jobs, compresslevel,
+                  store, progress, update=False):
+    if not update or not os.path.isfile(output_file):
+        with WebAnnoProjectWriter(output_file, name, template) as writer:
+            for path, (zinfo, data) in zip(paths, compress_files(
+                    paths, ['source/' + path.name for path in paths],
+                    jobs, compresslevel, store)):
+                writer.write_compressed(path.name, zinfo, data)
+                progress.update(zinfo.file_size)
+        return
+    # update mode: copy the unchanged entries from the existing zip file
+    # and write the result to a temporary file replacing it at the end
+    n_copied, n_compressed = 0, 0
+    with ZipFile(output_file) as old_zip:
+        old_entries = { zinfo.filename : zinfo \
+                        for zinfo in old_zip.infolist() \
+                        if zinfo.filename.startswith('source/') }
+        with WebAnnoProjectWriter(
+                output_file + '.tmp', name, template) as writer:
+            for path, (zinfo, data) in zip(paths, compress_files(
+                    paths, ['source/' + path.name for path in paths],
+                    jobs, compresslevel, store, old_entries)):
+                if data is None:
+                    writer.copy(path.name, old_zip, zinfo)
+                    n_copied += 1
+                else:
+                    writer.write_compressed(path.name, zinfo, data)
+                    n_compressed += 1
+                progress.update(zinfo.file_size)
+    os.replace(output_file + '.tmp', output_file)
+    n_removed = len(set(old_entries) - \
+                    set('source/' + path.name for path in paths))
+    logging.info(
+        'Updated {}: {} unchanged files copied, {} files compressed,'
+        ' {} files removed.'.format(
+            output_file, n_copied, n_compressed, n_removed))
+
+
+def package(corpus_dir, name, template, output_file=None, jobs=None,
+            compresslevel=DEFAULT_COMPRESSION_LEVEL, store=False,
+            max_docs=None, max_bytes=None, update=False):
+    '''
+    Package the files in `corpus_dir` as a WebAnno project. If `max_docs`
+    or `max_bytes` is given, the project is split into several parts
+    (see `split_into_parts()`), which are written in parallel to files
+    named like `output_file` with a part number (e.g. `NAME.1.zip`).
+
+    If `update` is set and the output file exists, the files having the
+    same size and CRC as the entries in it are copied without
+    recompression.
+    '''
     if output_file is None:
         output_file = name + '.zip'
-    with ZipFile(output_file, 'w', compression=ZIP_DEFLATED) as myzip:
-        sources = []
-        for path in Path(corpus_dir).glob('*'):
-            sources.append(path.name)
-            myzip.write(path, os.path.join('source', path.name))
-        template['name'] = name
-        template['source_documents'] = \
-            list(map(lambda source: { **sourceTemplate, 'name' : source },
-                     sources))
-        myzip.writestr('exportedproject.json', json.dumps(template))
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    paths = sorted(path for path in Path(corpus_dir).glob('*') \
+                   if path.name != MANIFEST_FILENAME)
+    progress = _Progress()
+    if max_docs is None and max_bytes is None:
+        _package_part(paths, name, template, output_file, jobs,
+                      compresslevel, store, progress, update)
+    else:
+        parts = split_into_parts(
+            [path.stat().st_size for path in paths], max_docs, max_bytes)
+        if not parts:
+            logging.warning('No files to package in {}'.format(corpus_dir))
+            return
+        base, ext = os.path.splitext(output_file)
+        # distribute the compression threads among the parts
+        n_parallel = min(jobs, len(parts))
+        part_jobs = max(1, jobs // n_parallel)
+        with ThreadPoolExecutor(max_workers=n_parallel) as executor:
+            futures = [executor.submit(
+                           _package_part, [paths[j] for j in part],
+                           '{} (part {})'.format(name, i),
+                           template, '{}.{}{}'.format(base, i, ext),
+                           part_jobs, compresslevel, store, progress,
+                           update) \
+                       for i, part in enumerate(parts, 1)]
+            for f in futures:
+                f.result()
+        logging.info('Written {} parts.'.format(len(parts)))
+    progress.log()
 
 
 def parse_arguments():
@@ -52,6 +179,35 @@ def parse_arguments():
     parser.add_argument(
         '-o', '--output-file', metavar='FILE',
         help='The name of the resulting zip file (default: NAME.zip)')
+    parser.add_argument(
+        '--max-docs', type=int, metavar='N',
+        help='Split the project into parts containing max. N documents.')
+    parser.add_argument(
+        '--max-bytes', type=int, metavar='N',
+        help='Split the project into parts containing max. N bytes'\
+             ' (of uncompressed files).')
+    parser.add_argument(
+        '-u', '--update', action='store_true',
+        help='Update an existing output file: copy the files that haven\'t'\
+             ' changed without recompressing them.')
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=None,
+        help='Number of threads compressing the files (default: number'\
+             ' of CPUs).')
+    parser.add_argument(
+        '-c', '--compression-level', type=int,
+        default=DEFAULT_COMPRESSION_LEVEL, choices=range(0, 10),
+        metavar='{0-9}',
+        help='Deflate compression level (default: {}).'\
+             .format(DEFAULT_COMPRESSION_LEVEL))
+    parser.add_argument(
+        '--store', action='store_true',
+        help='Store the files without compression (fastest).')
+    parser.add_argument(\
+        '-L', '--logging', default='WARNING',
+        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+        help='logging level')
+    add_profiling_arguments(parser)
     return parser.parse_args()
 
 
@@ -59,9 +215,17 @@ def check_arguments(args):
     pass
 
 
+@profiled
 def main():
     args = parse_arguments()
     check_arguments(args)
+    logging.basicConfig(
+        level=args.logging,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M')
     template = load_template(args.template_file)
-    package(args.input_dir, args.name, template, args.output_file)
+    package(args.input_dir, args.name, template, args.output_file,
+            jobs=args.jobs, compresslevel=args.compression_level,
+            store=args.store, max_docs=args.max_docs,
+            max_bytes=args.max_bytes, update=args.update)
 
@@ -0,0 +1,125 @@
+from collections import defaultdict
+from contextlib import contextmanager
+import json
+import logging
+import time
+
+
+DEFAULT_PROGRESS_INTERVAL = 10
+
+
+class Statistics:
+    '''
+    Counters and per-stage timings of a processing run.
+
+    The time is measured exclusively: while a stage pulls documents from
+    a preceding stage (e.g. writing pulls from annotation merge, which
+    pulls from reading), the time is charged to the preceding stage.
+    '''
+
+    def __init__(self, progress_interval=DEFAULT_PROGRESS_INTERVAL):
+        self.documents = 0
+        self.sentences = 0
+        self.tokens = 0
+        self.annotations = defaultdict(lambda: 0)
+        self.wall = defaultdict(lambda: 0.0)
+        self.cpu = defaultdict(lambda: 0.0)
+        self.progress_interval = progress_interval
+        self._stack = []
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._last_progress = self._start_wall
+
+    def _charge(self, frame, now_wall, now_cpu):
+        self.wall[frame[0]] += now_wall - frame[1]
+        self.cpu[frame[0]] += now_cpu - frame[2]
+        frame[1], frame[2] = now_wall, now_cpu
+
+    def _enter(self, stage):
+        now_wall, now_cpu = time.perf_counter(), time.process_time()
+        if self._stack:
+            self._charge(self._stack[-1], now_wall, now_cpu)
+        self._stack.append([stage, now_wall, now_cpu])
+
+    def _exit(self):
+        now_wall, now_cpu = time.perf_counter(), time.process_time()
+        self._charge(self._stack.pop(), now_wall, now_cpu)
+        if self._stack:
+            self._stack[-1][1], self._stack[-1][2] = now_wall, now_cpu
+
+    @contextmanager
+    def measure(self, stage):
+        'Charge the time spent in the `with` block to the given stage.'
+        self._enter(stage)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def stage(self, stage, docs):
+        'Charge the time spent generating the documents to the given stage.'
+        docs = iter(docs)
+        while True:
+            self._enter(stage)
+            try:
+                doc = next(docs)
+            except StopIteration:
+                return
+            finally:
+                self._exit()
+            yield doc
+
+    def count(self, docs):
+        'Count the documents passing through and log the progress.'
+        for doc in docs:
+            self.documents += 1
+            self.sentences += len(doc.sentences)
+            self.tokens += sum(len(s) for s in doc.sentences)
+            for layer, annotations in doc.annotations.items():
+                self.annotations[layer] += len(annotations)
+            now = time.perf_counter()
+            if now - self._last_progress >= self.progress_interval:
+                self._last_progress = now
+                elapsed = now - self._start_wall
+                logging.info(
+                    'Processed {} documents, {} tokens'
+                    ' ({:.1f} docs/s, {:.1f} tokens/s)'.format(
+                        self.documents, self.tokens,
+                        self.documents / elapsed, self.tokens / elapsed))
+            yield doc
+
+    def summary(self):
+        'Return the statistics as a dictionary.'
+        wall = time.perf_counter() - self._start_wall
+        cpu = time.process_time() - self._start_cpu
+        return {
+            'documents' : self.documents,
+            'sentences' : self.sentences,
+            'tokens' : self.tokens,
+            'annotations' : dict(self.annotations),
+            'stages' : { stage: { 'wall' : self.wall[stage],
+                                  'cpu' : self.cpu[stage] } \
+                         for stage in self.wall },
+            'total' : { 'wall' : wall, 'cpu' : cpu },
+            'docs_per_sec' : self.documents / wall if wall > 0 else 0,
+            'tokens_per_sec' : self.tokens / wall if wall > 0 else 0
+        }
+
+    def write_summary(self, fp):
+        'Write a human-readable summary to a file.'
+        s = self.summary()
+        fp.write('documents: {}\nsentences: {}\ntokens: {}\n'.format(
+            s['documents'], s['sentences'], s['tokens']))
+        for layer, n in sorted(s['annotations'].items()):
+            fp.write('annotations ({}): {}\n'.format(layer, n))
+        for stage, t in s['stages'].items():
+            fp.write('time ({}): wall={:.2f}s cpu={:.2f}s\n'.format(
+                stage, t['wall'], t['cpu']))
+        fp.write('time (total): wall={:.2f}s cpu={:.2f}s\n'.format(
+            s['total']['wall'], s['total']['cpu']))
+        fp.write('throughput: {:.1f} docs/s, {:.1f} tokens/s\n'.format(
+            s['docs_per_sec'], s['tokens_per_sec']))
+
+    def save_json(self, filename):
+        with open(filename, 'w+') as fp:
+            json.dump(self.summary(), fp, indent=2)
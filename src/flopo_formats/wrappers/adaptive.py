@@ -0,0 +1,144 @@
+from collections import Counter
+import logging
+import math
+import threading
+import time
+
+
+DEFAULT_RETRY_BUDGET = 100
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_COOLDOWN = 30
+# a request is considered slow if its latency per unit of work is this many
+# times the lowest one observed so far
+DEFAULT_LATENCY_TOLERANCE = 2.0
+DECREASE_FACTOR = 0.75
+
+
+def _latency_bucket(latency):
+    'Round the latency (in seconds) up to a power of two.'
+    return 2.0 ** math.ceil(math.log2(max(latency, 2.0 ** -10)))
+
+
+class AdaptiveController:
+    '''
+    Controls the requests to a remote service shared by many threads.
+
+    - The number of requests in flight is adjusted between 1 and
+      `max_concurrency` (AIMD): it grows slowly after fast successful
+      requests and is cut after failures or slow responses.
+    - The total number of retries is capped by `retry_budget`. After
+      it is exhausted, `retry()` raises a RuntimeError.
+    - After `failure_threshold` consecutive failures, the circuit breaker
+      opens: no requests are started for `cooldown` seconds, after which
+      a single trial request is let through. If it succeeds, the circuit
+      is closed again, otherwise it stays open for another `cooldown`.
+    - The latencies of successful requests are collected in a histogram.
+
+    Usage: call `acquire()` before starting a request, `release()` after
+    it has finished and `retry()` before retrying a failed request.
+    '''
+
+    def __init__(self, max_concurrency, retry_budget=DEFAULT_RETRY_BUDGET,
+                 failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 cooldown=DEFAULT_COOLDOWN,
+                 latency_tolerance=DEFAULT_LATENCY_TOLERANCE):
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.retry_budget = retry_budget
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.retries = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.circuit_opened = 0
+        self.open_until = None
+        self.min_rate = None
+        self.latencies = Counter()
+        self.cond = threading.Condition()
+
+    def _wait_time(self):
+        '''
+        Return 0 if a request can be started now, otherwise the time to wait
+        (or None if it is needed to wait for a running request).
+        '''
+        if self.open_until is not None:
+            now = time.monotonic()
+            if now < self.open_until:
+                return self.open_until - now
+            # half-open circuit: let through a single trial request
+            return 0 if self.in_flight == 0 else None
+        return 0 if self.in_flight < int(self.limit) else None
+
+    def acquire(self):
+        'Wait until a new request can be started.'
+        with self.cond:
+            while True:
+                wait_time = self._wait_time()
+                if wait_time == 0:
+                    break
+                self.cond.wait(wait_time)
+            self.in_flight += 1
+
+    def release(self, latency, ok, size=1):
+        '''
+        Register a finished request. `size` is the amount of work done by
+        the request (e.g. number of tokens), to which the latency is
+        related.
+        '''
+        with self.cond:
+            self.in_flight -= 1
+            if ok:
+                self._success(latency, size)
+            else:
+                self._failure()
+            self.cond.notify_all()
+
+    def _success(self, latency, size):
+        self.latencies[_latency_bucket(latency)] += 1
+        self.consecutive_failures = 0
+        if self.open_until is not None:
+            logging.info('Remote service is back, closing the circuit.')
+            self.open_until = None
+        rate = latency / max(size, 1)
+        if self.min_rate is None or rate < self.min_rate:
+            self.min_rate = rate
+        if rate > self.latency_tolerance * self.min_rate:
+            self.limit = max(1.0, self.limit * DECREASE_FACTOR)
+        else:
+            self.limit = min(self.max_concurrency, self.limit + 1/self.limit)
+
+    def _failure(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.limit = max(1.0, self.limit / 2)
+        if self.open_until is not None \
+                or self.consecutive_failures >= self.failure_threshold:
+            self.circuit_opened += 1
+            self.open_until = time.monotonic() + self.cooldown
+            logging.warning(
+                'Remote service seems to be down ({} consecutive failures),'
+                ' pausing requests for {} s.'\
+                .format(self.consecutive_failures, self.cooldown))
+
+    def retry(self):
+        'Consume one retry from the budget.'
+        with self.cond:
+            if self.retries >= self.retry_budget:
+                raise RuntimeError(
+                    'Retry budget exhausted ({} retries).'\
+                    .format(self.retry_budget))
+            self.retries += 1
+
+    def log_statistics(self):
+        'Log the latency histogram and the counts of failures and retries.'
+        total = sum(self.latencies.values())
+        logging.info(
+            'Requests: {} successful, {} failed, {} retries,'
+            ' circuit opened {} times, final concurrency: {}'\
+            .format(total, self.failures, self.retries,
+                    self.circuit_opened, int(self.limit)))
+        for bucket, n in sorted(self.latencies.items()):
+            logging.info('Latency <= {:g} s: {} ({:.1f}%)'\
+                         .format(bucket, n, 100 * n / total))
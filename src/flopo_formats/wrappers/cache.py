@@ -0,0 +1,147 @@
+from collections import defaultdict, deque
+import hashlib
+import json
+import logging
+import sqlite3
+
+
+DEFAULT_CACHE_SIZE = 1000000
+# number of `put()` calls after which the changes are committed
+COMMIT_INTERVAL = 1000
+
+
+def _sentence_key(tokens):
+    return hashlib.sha1('\n'.join(tokens).encode('utf-8')).hexdigest()
+
+
+class SentenceCache:
+    '''
+    An on-disk (SQLite) cache of tagger results for single sentences,
+    keyed by a hash of the token sequence. The stored value is a list of
+    spans: (tok_start_id, tok_end_id, label).
+
+    The cache holds max. `max_size` sentences -- the least recently used
+    ones are evicted. If the cache was created with a different
+    `tagger_version`, its contents are discarded.
+    '''
+
+    def __init__(self, path, max_size=DEFAULT_CACHE_SIZE, tagger_version=''):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.uncommitted = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS sentences'
+            ' (key TEXT PRIMARY KEY, spans TEXT, last_used INTEGER)')
+        self.conn.execute(
+            'CREATE INDEX IF NOT EXISTS sentences_last_used'
+            ' ON sentences (last_used)')
+        row = self.conn.execute(
+            'SELECT value FROM meta WHERE key = ?',
+            ('tagger_version',)).fetchone()
+        if row is not None and row[0] != tagger_version:
+            logging.info(
+                'Tagger version changed ({} -> {}), clearing the cache.'\
+                .format(row[0], tagger_version))
+            self.conn.execute('DELETE FROM sentences')
+        self.conn.execute(
+            'INSERT OR REPLACE INTO meta VALUES (?, ?)',
+            ('tagger_version', tagger_version))
+        self.clock = self.conn.execute(
+            'SELECT COALESCE(MAX(last_used), 0) FROM sentences').fetchone()[0]
+        self.conn.commit()
+
+    def get(self, sentences):
+        '''
+        Look up a list of sentences (each being a list of tokens). Returns
+        a list containing for each sentence either the list of spans or
+        None if the sentence is not cached.
+        '''
+        result = []
+        hits = []
+        self.clock += 1
+        for tokens in sentences:
+            key = _sentence_key(tokens)
+            row = self.conn.execute(
+                'SELECT spans FROM sentences WHERE key = ?', (key,))\
+                .fetchone()
+            if row is not None:
+                result.append([tuple(s) for s in json.loads(row[0])])
+                hits.append((self.clock, key))
+            else:
+                result.append(None)
+        self.conn.executemany(
+            'UPDATE sentences SET last_used = ? WHERE key = ?', hits)
+        self.hits += len(hits)
+        self.misses += len(result) - len(hits)
+        return result
+
+    def put(self, items):
+        'Store pairs: (sentence, spans) in the cache.'
+        self.clock += 1
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO sentences VALUES (?, ?, ?)',
+            ((_sentence_key(tokens), json.dumps(spans), self.clock) \
+             for tokens, spans in items))
+        self.uncommitted += 1
+        if self.uncommitted >= COMMIT_INTERVAL:
+            self.commit()
+
+    def commit(self):
+        'Evict the least recently used sentences and commit the changes.'
+        n = self.conn.execute('SELECT COUNT(*) FROM sentences').fetchone()[0]
+        if n > self.max_size:
+            self.conn.execute(
+                'DELETE FROM sentences WHERE key IN'
+                ' (SELECT key FROM sentences ORDER BY last_used LIMIT ?)',
+                (n - self.max_size,))
+        self.conn.commit()
+        self.uncommitted = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+        total = self.hits + self.misses
+        logging.info(
+            'Sentence cache: {} hits, {} misses ({:.1f}% hit rate)'.format(
+                self.hits, self.misses,
+                100 * self.hits / total if total > 0 else 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def annotate_docs_cached(docs, annotate_docs, cache):
+    '''
+    Annotate documents given as pairs: (doc_id, sentences) using the
+    sentence cache. Only the sentences missing from the cache are passed
+    to `annotate_docs` (a function taking and yielding pairs like
+    `FinerPool.annotate_docs()`) and the sentence ids in its results are
+    mapped back to the original document.
+    '''
+    pending = deque()
+
+    def _uncached_docs():
+        for doc_id, sentences in docs:
+            cached = cache.get(sentences)
+            missing = [i for i, spans in enumerate(cached) if spans is None]
+            pending.append((sentences, cached, missing))
+            yield doc_id, [sentences[i] for i in missing]
+
+    for doc_id, spans in annotate_docs(_uncached_docs()):
+        sentences, cached, missing = pending.popleft()
+        new_spans = defaultdict(list)
+        for s_id, start, end, label in spans:
+            new_spans[missing[s_id-1]].append((start, end, label))
+        cache.put((sentences[i], new_spans[i]) for i in missing)
+        yield doc_id, [
+            (i+1, start, end, label) \
+            for i, s_spans in enumerate(cached) \
+            for start, end, label in \
+                (s_spans if s_spans is not None else new_spans[i])]
@@ -0,0 +1,110 @@
+from collections import defaultdict, deque, OrderedDict
+import hashlib
+import logging
+
+
+# memory budget for the fingerprints in MiB
+DEFAULT_MEMORY_BUDGET = 256
+# estimated memory usage of a single stored fingerprint (in bytes)
+ENTRY_SIZE = 200
+
+
+class _Slot:
+    'The result for a sentence, which is filled in when it is tagged.'
+    __slots__ = ('key', 'spans')
+
+    def __init__(self, key, spans=None):
+        self.key = key
+        self.spans = spans
+
+
+class FingerprintStore:
+    '''
+    Fingerprints of sentences seen in a document stream together with their
+    tagging results.
+
+    The sentences that are sent to the tagger but not yet tagged are kept
+    as "pending". The memory used for the tagged sentences is bounded by
+    `memory_budget` (in MiB) -- the least recently seen ones are forgotten
+    and tagged again if they reoccur.
+    '''
+
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET):
+        self.max_entries = max(1, memory_budget * 2**20 // ENTRY_SIZE)
+        self.results = OrderedDict()
+        self.pending = {}
+        self.sentences = 0
+        self.unique = 0
+
+    def lookup(self, tokens):
+        '''
+        Look up a sentence. Returns a pair: (slot, is_new), where `is_new`
+        means that the sentence has to be tagged and the results passed to
+        `resolve()`. Otherwise `slot.spans` will be available after the
+        previous occurrence of the sentence has been resolved.
+        '''
+        key = hashlib.blake2b(
+            '\n'.join(tokens).encode('utf-8'), digest_size=16).digest()
+        self.sentences += 1
+        if key in self.results:
+            self.results.move_to_end(key)
+            return _Slot(key, self.results[key]), False
+        elif key in self.pending:
+            return self.pending[key], False
+        slot = _Slot(key)
+        self.pending[key] = slot
+        self.unique += 1
+        return slot, True
+
+    def resolve(self, slot, spans):
+        slot.spans = tuple(spans)
+        del self.pending[slot.key]
+        self.results[slot.key] = slot.spans
+        while len(self.results) > self.max_entries:
+            self.results.popitem(last=False)
+
+    def dedup_ratio(self):
+        'The share of sentences that were not sent to the tagger.'
+        return 1 - self.unique / self.sentences if self.sentences > 0 else 0
+
+    def log_statistics(self):
+        logging.info(
+            'Deduplication: {} sentences, {} unique sent to the tagger'
+            ' (dedup ratio: {:.1f}%)'.format(
+                self.sentences, self.unique, 100 * self.dedup_ratio()))
+
+
+def annotate_docs_deduplicated(docs, annotate_docs, store):
+    '''
+    Annotate documents given as pairs: (doc_id, sentences), passing each
+    distinct sentence to `annotate_docs` (a function taking and yielding
+    pairs like `FinerPool.annotate_docs()`) only once. The results are
+    copied to all occurrences of the sentence.
+
+    Since the results of `annotate_docs` come in the order of the input,
+    the first occurrence of a sentence is always resolved before (or in
+    the same document as) the later ones.
+    '''
+    pending = deque()
+
+    def _unique_docs():
+        for doc_id, sentences in docs:
+            slots, new = [], []
+            for i, tokens in enumerate(sentences):
+                slot, is_new = store.lookup(tokens)
+                slots.append(slot)
+                if is_new:
+                    new.append(i)
+            pending.append((slots, new))
+            yield doc_id, [sentences[i] for i in new]
+
+    for doc_id, spans in annotate_docs(_unique_docs()):
+        slots, new = pending.popleft()
+        new_spans = defaultdict(list)
+        for s_id, start, end, label in spans:
+            new_spans[new[s_id-1]].append((start, end, label))
+        for i in new:
+            store.resolve(slots[i], new_spans[i])
+        yield doc_id, [(i+1, start, end, label) \
+                       for i, slot in enumerate(slots) \
+                       for start, end, label in slot.spans]
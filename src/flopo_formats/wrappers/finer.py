@@ -1,14 +1,38 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import itertools
 import logging
 from operator import itemgetter
+import queue
 import re
 import subprocess
+import threading
+import time
+from urllib3.exceptions import HTTPError
 from urllib3.util.retry import Retry
 from urllib3.poolmanager import PoolManager
 import urllib.request
 
+from flopo_formats.wrappers.adaptive import AdaptiveController
+
 
 ANNOTATION_PATTERN = re.compile('<(/?)(\w+)(/?)>')
 REMOTE_FINER_URL = 'https://finer-flopo.rahtiapp.fi'
+FINER_COMMAND = ['finnish-nertag', '--no-tokenize']
+# a token marking the end of a document in a persistent FINER session
+# (followed by a sequence number)
+DOC_DELIMITER = 'FLOPODOCUMENTEND'
+DEFAULT_TIMEOUT = 600
+# number of documents that are scheduled together by FinerPool
+DEFAULT_WINDOW = 100
+# number of documents sent to the remote FINER in a single request
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_MAX_REQUESTS = 4
+DEFAULT_REQUEST_TIMEOUT = 300
+# HTTP status codes after which a request is retried
+RETRY_STATUS = (429, 500, 502, 503, 504)
+DEFAULT_BACKOFF = 0.5
+MAX_BACKOFF = 60
 
 
 def _flatten_sentences(sentences):
@@ -42,7 +66,7 @@ def _finer_local_annotate(tokens):
     Return a list of pairs: (token, finer_tag)
     '''
     p = subprocess.Popen(
-        ['finnish-nertag', '--no-tokenize'],
+        FINER_COMMAND,
         stdin=subprocess.PIPE,
         stdout=subprocess.PIPE,
         text=True)
@@ -51,7 +75,125 @@ def _finer_local_annotate(tokens):
     p.wait()
     return result
 
-http = PoolManager(retries=Retry(999,method_whitelist=False,backoff_factor=0.5))
+
+class FinerSession:
+    '''
+    A persistent FINER process used to annotate many documents, so that
+    the model is loaded only once.
+
+    After each document, a delimiter token with a sequence number is sent
+    as a separate sentence. The output is read until the delimiter comes
+    back -- any output preceding a delimiter of an earlier document
+    (e.g. after a timeout) is discarded. If the process crashes or doesn't
+    respond within `timeout` seconds, it is restarted and the document
+    is tagged again (max. `max_retries` times).
+    '''
+
+    def __init__(self, command=FINER_COMMAND, timeout=DEFAULT_TIMEOUT,
+                 max_retries=3):
+        self.command = command
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.process = None
+        self.lines = None
+        self.counter = 0
+
+    def _read_output(self, process, lines):
+        for line in process.stdout:
+            lines.put(line.rstrip('\n'))
+        # end of output -- the process has terminated
+        process.stdout.close()
+        lines.put(None)
+
+    def start(self):
+        self.process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1)
+        # the output is read in a separate thread, so that FINER never
+        # blocks on writing while we're writing the input
+        self.lines = queue.Queue()
+        threading.Thread(
+            target=self._read_output, args=(self.process, self.lines),
+            daemon=True).start()
+
+    def close(self):
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+            try:
+                self.process.wait(timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+            self.process = None
+
+    def restart(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+            self.process = None
+        self.start()
+
+    def _tag(self, tokens):
+        if self.process is None:
+            self.start()
+        self.counter += 1
+        delimiter = DOC_DELIMITER + str(self.counter)
+        self.process.stdin.write(
+            ''.join(t + '\n' for t in tokens) + '\n' + delimiter + '\n\n')
+        self.process.stdin.flush()
+        out = []
+        while True:
+            line = self.lines.get(timeout=self.timeout)
+            if line is None:
+                raise RuntimeError('FINER process terminated unexpectedly')
+            token = line.split('\t')[0]
+            if token == delimiter:
+                return _convert_finer_output('\n'.join(out))
+            elif token.startswith(DOC_DELIMITER):
+                # a delimiter of some earlier document -- discard
+                # everything that came before
+                out = []
+            else:
+                out.append(line)
+
+    def tag(self, tokens):
+        '''
+        Annotate a list of tokens. Return a list of pairs: (token, finer_tag)
+        '''
+        tokens = list(tokens)
+        for i in range(self.max_retries+1):
+            try:
+                return self._tag(tokens)
+            except (RuntimeError, OSError, queue.Empty) as e:
+                if i >= self.max_retries:
+                    raise RuntimeError(
+                        'FINER failed {} times, giving up.'.format(i+1)) \
+                        from e
+                logging.warning(
+                    'Restarting FINER ({}: {})'\
+                    .format(type(e).__name__, str(e)))
+                self.restart()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+http = PoolManager(retries=Retry(10,method_whitelist=False,backoff_factor=0.5,
+                                 status_forcelist=RETRY_STATUS))
 
 def _finer_remote_annotate(tokens):
     '''
@@ -61,8 +203,10 @@ def _finer_remote_annotate(tokens):
     return _convert_finer_output(r.data.decode('utf-8'))
 
 
-def _finer_annotate(tokens, remote=False):
-    if remote:
+def _finer_annotate(tokens, remote=False, session=None):
+    if session is not None:
+        return session.tag(tokens)
+    elif remote:
         return _finer_remote_annotate(tokens)
     else:
         return _finer_local_annotate(tokens)
@@ -118,15 +262,12 @@ def _process_tag(tag, s_id, t_id, start):
         return None, start, 'Ignoring invalid tag'
 
 
-def annotate(sentences, remote=False):
+def _finer_output_to_spans(tokens, finer_out):
     '''
-    Takes a list of sentences (each being a list of tokens) and runs
-    FINER. Returns a list of tuples:
+    Convert the FINER output for the tokens returned by
+    `_flatten_sentences()` to spans:
     (sentence_id, tok_start_id, tok_end_id, label)
     '''
-
-    tokens = _flatten_sentences(sentences)
-    finer_out = _finer_annotate(map(itemgetter(2), tokens), remote=remote)
     spans = []
     start = None
     for i, ((s_id, t_id, t1), (t2, tag)) in enumerate(zip(tokens, finer_out)):
@@ -144,3 +285,200 @@ def annotate(sentences, remote=False):
                             .format(err_msg, s_id, t_id, tag))
     return spans
 
+
+def annotate(sentences, remote=False, session=None):
+    '''
+    Takes a list of sentences (each being a list of tokens) and runs
+    FINER. Returns a list of tuples:
+    (sentence_id, tok_start_id, tok_end_id, label)
+
+    If `session` (a FinerSession) is given, it is used instead of starting
+    a new FINER process.
+    '''
+
+    tokens = _flatten_sentences(sentences)
+    finer_out = _finer_annotate(
+        map(itemgetter(2), tokens), remote=remote, session=session)
+    return _finer_output_to_spans(tokens, finer_out)
+
+
+class FinerPool:
+    '''
+    A pool of `jobs` persistent FINER processes annotating documents in
+    parallel.
+
+    The documents are read in windows of `window` documents and each
+    window is scheduled longest first, so that a long document doesn't
+    end up running alone at the end of the window. The next window is
+    already scheduled while the results of the current one are returned.
+    '''
+
+    def __init__(self, jobs, command=FINER_COMMAND, timeout=DEFAULT_TIMEOUT,
+                 window=DEFAULT_WINDOW):
+        self.jobs = jobs
+        self.window = window
+        self.sessions = queue.Queue()
+        for i in range(jobs):
+            self.sessions.put(FinerSession(command, timeout=timeout))
+        self.executor = ThreadPoolExecutor(max_workers=jobs)
+
+    def _annotate(self, sentences):
+        # each worker thread borrows a session for the time of one document
+        session = self.sessions.get()
+        try:
+            return annotate(sentences, session=session)
+        finally:
+            self.sessions.put(session)
+
+    def _submit_window(self, docs):
+        futures = [None] * len(docs)
+        lengths = [sum(len(s) for s in sentences) for _, sentences in docs]
+        for i in sorted(range(len(docs)), key=lambda i: -lengths[i]):
+            futures[i] = self.executor.submit(self._annotate, docs[i][1])
+        return [(doc_id, f) for (doc_id, _), f in zip(docs, futures)]
+
+    def annotate_docs(self, docs):
+        '''
+        Annotate documents given as pairs: (doc_id, sentences). Yields pairs:
+        (doc_id, spans) in the order of the input, where `spans` are
+        like the result of `annotate()`.
+        '''
+        docs = iter(docs)
+        pending = []
+        while True:
+            window = []
+            for doc in docs:
+                window.append(doc)
+                if len(window) >= self.window:
+                    break
+            submitted = self._submit_window(window) if window else []
+            for doc_id, future in pending:
+                yield doc_id, future.result()
+            if not submitted:
+                break
+            pending = submitted
+
+    def close(self):
+        self.executor.shutdown()
+        while not self.sessions.empty():
+            self.sessions.get().close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class RemoteFiner:
+    '''
+    A client for a remote FINER instance sending many documents in a single
+    request and keeping up to `max_requests` requests in flight.
+
+    The documents in a request are separated by numbered delimiter tokens
+    (like in `FinerSession`) and the response is split back into documents
+    at the delimiters.
+
+    The requests are throttled by an `AdaptiveController` (or `controller`,
+    if given): the number of requests in flight adapts to the latency and
+    errors, the number of retries is capped and the requests are paused
+    if the service is down.
+    '''
+
+    def __init__(self, url=REMOTE_FINER_URL, batch_size=DEFAULT_BATCH_SIZE,
+                 max_requests=DEFAULT_MAX_REQUESTS,
+                 timeout=DEFAULT_REQUEST_TIMEOUT, backoff=DEFAULT_BACKOFF,
+                 controller=None):
+        self.url = url
+        self.batch_size = batch_size
+        self.max_requests = max_requests
+        self.timeout = timeout
+        self.backoff = backoff
+        self.controller = controller if controller is not None \
+                          else AdaptiveController(max_requests)
+        self.http = PoolManager(maxsize=max_requests, retries=False)
+        self.executor = ThreadPoolExecutor(max_workers=max_requests)
+
+    def _post(self, fields, size):
+        for attempt in itertools.count():
+            r, error = None, None
+            self.controller.acquire()
+            start = time.monotonic()
+            try:
+                r = self.http.request(
+                    'POST', self.url, fields=fields, timeout=self.timeout)
+                if r.status != 200:
+                    error = 'status {}'.format(r.status)
+            except HTTPError as e:
+                error = str(e)
+            finally:
+                self.controller.release(
+                    time.monotonic() - start, error is None, size)
+            if error is None:
+                return r.data.decode('utf-8')
+            elif r is not None and r.status not in RETRY_STATUS:
+                raise RuntimeError(
+                    'Remote FINER returned status {}'.format(r.status))
+            logging.warning(
+                'Remote FINER request failed ({}), retrying.'.format(error))
+            self.controller.retry()
+            time.sleep(min(self.backoff * 2**attempt, MAX_BACKOFF))
+
+    def _request(self, batch):
+        tokens = []
+        for i, (doc_id, doc_tokens) in enumerate(batch):
+            tokens.extend(map(itemgetter(2), doc_tokens))
+            tokens.extend(('', DOC_DELIMITER + str(i), ''))
+        out = self._post(
+            { 'text': '\n'.join(tokens), 'pretokenized': 'true' },
+            len(tokens))
+        results, out_lines = {}, []
+        for line in out.split('\n'):
+            token = line.split('\t')[0]
+            if token.startswith(DOC_DELIMITER):
+                results[token] = _convert_finer_output('\n'.join(out_lines))
+                out_lines = []
+            else:
+                out_lines.append(line)
+        spans = []
+        for i, (doc_id, doc_tokens) in enumerate(batch):
+            finer_out = results.get(DOC_DELIMITER + str(i))
+            if finer_out is None:
+                raise RuntimeError(
+                    'Document delimiter missing in remote FINER output'\
+                    ' for document: {}'.format(doc_id))
+            spans.append(
+                (doc_id, _finer_output_to_spans(doc_tokens, finer_out)))
+        return spans
+
+    def annotate_docs(self, docs):
+        '''
+        Annotate documents given as pairs: (doc_id, sentences). Yields pairs:
+        (doc_id, spans) in the order of the input, where `spans` are
+        like the result of `annotate()`.
+        '''
+        pending = deque()
+        batch = []
+        for doc_id, sentences in docs:
+            batch.append((doc_id, _flatten_sentences(sentences)))
+            if len(batch) >= self.batch_size:
+                pending.append(self.executor.submit(self._request, batch))
+                batch = []
+            # keep one batch waiting for each request in flight
+            while len(pending) > 2*self.max_requests:
+                yield from pending.popleft().result()
+        if batch:
+            pending.append(self.executor.submit(self._request, batch))
+        while pending:
+            yield from pending.popleft().result()
+
+    def close(self):
+        self.executor.shutdown()
+        self.http.clear()
+        self.controller.log_statistics()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
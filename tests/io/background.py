@@ -0,0 +1,34 @@
+import os.path
+import tempfile
+import unittest
+
+from flopo_formats.io.background import BackgroundWriter
+
+
+class BackgroundWriterTest(unittest.TestCase):
+
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = [os.path.join(tmpdir, 'file{}.txt'.format(i)) \
+                     for i in range(3)]
+            with BackgroundWriter(flush_size=10, queue_size=2) as writer:
+                fps = [writer.open(p) for p in paths]
+                for i in range(100):
+                    for j, fp in enumerate(fps):
+                        fp.write('{}-{}\n'.format(j, i))
+                for fp in fps:
+                    fp.close()
+            for j, p in enumerate(paths):
+                with open(p) as fp:
+                    self.assertEqual(
+                        fp.read(),
+                        ''.join('{}-{}\n'.format(j, i) for i in range(100)))
+
+    def test_error(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'nonexistent', 'file.txt')
+            writer = BackgroundWriter()
+            with writer.open(path) as fp:
+                fp.write('test')
+            with self.assertRaises(RuntimeError):
+                writer.close()
@@ -0,0 +1,173 @@
+import os
+import os.path
+import tempfile
+import unittest
+from zipfile import ZipFile
+
+from flopo_formats.data import Document, Sentence, Token
+from flopo_formats.io.generic import \
+    _get_filenames, read_webanno_zip, write_docs, zip_entry_doc_id, \
+    MANIFEST_FILENAME
+
+
+class GetFilenamesTest(unittest.TestCase):
+
+    FILES = ['b.tsv', 'a.tsv', 'c.txt', 'sub/x.tsv', 'a/z.tsv']
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        for f in self.FILES:
+            path = os.path.join(self.tmpdir.name, f)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'w+').close()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _get_filenames(self, *args, **kwargs):
+        return [os.path.relpath(f, self.tmpdir.name) \
+                for f in _get_filenames(self.tmpdir.name, *args, **kwargs)]
+
+    def test_get_filenames(self):
+        self.assertEqual(
+            self._get_filenames(),
+            ['a.tsv', 'b.tsv', 'c.txt'])
+        self.assertEqual(
+            self._get_filenames(recursive=True),
+            ['a/z.tsv', 'a.tsv', 'b.tsv', 'c.txt', 'sub/x.tsv'])
+
+    def test_filter(self):
+        self.assertEqual(
+            self._get_filenames(
+                recursive=True, include=['*.tsv'], exclude=['sub/*']),
+            ['a/z.tsv', 'a.tsv', 'b.tsv'])
+        self.assertEqual(
+            self._get_filenames(recursive=True, exclude=['a*']),
+            ['b.tsv', 'c.txt', 'sub/x.tsv'])
+
+
+class IncrementalWriteTest(unittest.TestCase):
+
+    TEXTS = { 'doc1' : 'Hei maailma', 'doc2' : 'Uusi lause' }
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.texts = dict(self.TEXTS)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _docs(self):
+        for doc_id, text in sorted(self.texts.items()):
+            tokens = [Token(i, w) for i, w in enumerate(text.split(), 1)]
+            yield Document(doc_id, [], [Sentence(tokens, 1, 1)])
+
+    def _path(self, doc_id):
+        return os.path.join(self.tmpdir.name, doc_id)
+
+    def _write(self):
+        write_docs(self._docs(), self.tmpdir.name, 'webanno-tsv',
+                   incremental=True)
+
+    def _mark_outputs(self):
+        'Overwrite the output files to see which ones are rewritten.'
+        for doc_id in self.texts:
+            with open(self._path(doc_id), 'w+') as fp:
+                fp.write('old')
+
+    def _rewritten(self):
+        result = []
+        for doc_id in sorted(self.texts):
+            with open(self._path(doc_id)) as fp:
+                if fp.read() != 'old':
+                    result.append(doc_id)
+        return result
+
+    def test_skip_unchanged(self):
+        self._write()
+        self.assertEqual(self._rewritten(), ['doc1', 'doc2'])
+        self.assertTrue(os.path.isfile(self._path(MANIFEST_FILENAME)))
+        self._mark_outputs()
+        self._write()
+        self.assertEqual(self._rewritten(), [])
+
+    def test_rewrite_changed(self):
+        self._write()
+        self._mark_outputs()
+        self.texts['doc2'] = 'Muuttunut lause'
+        self._write()
+        self.assertEqual(self._rewritten(), ['doc2'])
+        with open(self._path('doc2')) as fp:
+            self.assertIn('Muuttunut', fp.read())
+
+    def test_rewrite_deleted(self):
+        self._write()
+        self._mark_outputs()
+        os.remove(self._path('doc1'))
+        self._write()
+        self.assertEqual(self._rewritten(), ['doc1'])
+
+    def test_corrupt_manifest(self):
+        self._write()
+        self._mark_outputs()
+        with open(self._path(MANIFEST_FILENAME), 'w+') as fp:
+            fp.write('{"format": "webanno-tsv", "docu')
+        with self.assertLogs(level='WARNING'):
+            self._write()
+        self.assertEqual(self._rewritten(), ['doc1', 'doc2'])
+        # the manifest is repaired
+        self._mark_outputs()
+        self._write()
+        self.assertEqual(self._rewritten(), [])
+
+
+class ReadWebAnnoZipTest(unittest.TestCase):
+
+    TEST_DOC = \
+'''#FORMAT=WebAnno TSV 3.2
+
+
+#Text=Hei maailma
+1-1	0-3	Hei
+1-2	4-11	maailma
+'''
+
+    ENTRIES = ['source/b.tsv', 'source/a.tsv', 'annotation/a.tsv/alice.tsv',
+               'curation/a.tsv/CURATION_USER.tsv']
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'project.zip')
+        with ZipFile(self.path, 'w') as zf:
+            for name in self.ENTRIES:
+                zf.writestr(name, self.TEST_DOC)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _read(self, **kwargs):
+        return [(doc.doc_id, [t.string for s in doc.sentences for t in s.tokens]) \
+                for doc in read_webanno_zip(self.path, **kwargs)]
+
+    def test_read(self):
+        for jobs in (1, 2):
+            self.assertEqual(
+                self._read(jobs=jobs),
+                [('a', ['Hei', 'maailma']),
+                 ('b', ['Hei', 'maailma'])])
+
+    def test_filter(self):
+        self.assertEqual(
+            [doc_id for doc_id, tokens in self._read(
+                include=['annotation/*', 'curation/*'],
+                exclude=['alice.tsv'])],
+            ['a'])
+
+    def test_doc_id(self):
+        self.assertEqual(zip_entry_doc_id('source/doc00.tsv'), 'doc00')
+        self.assertEqual(zip_entry_doc_id('doc00.tsv'), 'doc00')
+        self.assertEqual(zip_entry_doc_id('source/doc00'), 'doc00')
+        self.assertEqual(
+            zip_entry_doc_id('annotation/doc00.tsv/alice.tsv'), 'doc00')
+        self.assertEqual(
+            zip_entry_doc_id('curation/doc00.tsv/CURATION_USER.tsv'), 'doc00')
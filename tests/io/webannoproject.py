@@ -0,0 +1,131 @@
+import json
+import os.path
+import tempfile
+import unittest
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+import zlib
+
+from flopo_formats.io.webannoproject import \
+    read_raw_entry, write_raw_entry, WebAnnoProjectWriter
+
+
+class RawEntryTest(unittest.TestCase):
+
+    ENTRIES = [
+        ('deflated', ZIP_DEFLATED, b'#FORMAT=WebAnno TSV 3.2\n' * 100),
+        ('stored', ZIP_STORED, 'äöå\n'.encode('utf-8')),
+        ('empty-deflated', ZIP_DEFLATED, b''),
+        ('empty-stored', ZIP_STORED, b'')
+    ]
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path_1 = os.path.join(self.tmpdir.name, 'input.zip')
+        self.path_2 = os.path.join(self.tmpdir.name, 'output.zip')
+        with ZipFile(self.path_1, 'w') as zf:
+            for name, compress_type, data in self.ENTRIES:
+                zf.writestr(name, data, compress_type=compress_type)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_round_trip(self):
+        with ZipFile(self.path_1) as zf_in, \
+                ZipFile(self.path_2, 'w') as zf_out:
+            zf_out.writestr('first', b'written normally')
+            for zinfo in zf_in.infolist():
+                write_raw_entry(zf_out, *read_raw_entry(zf_in, zinfo))
+            zf_out.writestr('last', b'written normally',
+                            compress_type=ZIP_DEFLATED)
+        with ZipFile(self.path_1) as zf_in, ZipFile(self.path_2) as zf_out:
+            self.assertIsNone(zf_out.testzip())
+            self.assertEqual(
+                zf_out.namelist(),
+                ['first'] + [name for name, _, _ in self.ENTRIES] + ['last'])
+            for name, compress_type, data in self.ENTRIES:
+                zinfo_in, zinfo_out = zf_in.getinfo(name), zf_out.getinfo(name)
+                self.assertEqual(zf_out.read(name), data)
+                self.assertEqual(zinfo_out.CRC, zlib.crc32(data))
+                for attr in ('compress_type', 'CRC', 'file_size',
+                             'compress_size', 'date_time'):
+                    self.assertEqual(
+                        getattr(zinfo_out, attr), getattr(zinfo_in, attr))
+                self.assertEqual(zinfo_out.compress_type, compress_type)
+
+    def test_append(self):
+        # writing raw entries to a zip file opened in append mode
+        with ZipFile(self.path_2, 'w') as zf_out:
+            zf_out.writestr('first', b'written normally')
+        with ZipFile(self.path_1) as zf_in, \
+                ZipFile(self.path_2, 'a') as zf_out:
+            for zinfo in zf_in.infolist():
+                write_raw_entry(zf_out, *read_raw_entry(zf_in, zinfo))
+        with ZipFile(self.path_2) as zf_out:
+            self.assertIsNone(zf_out.testzip())
+            self.assertEqual(zf_out.read('first'), b'written normally')
+            for name, _, data in self.ENTRIES:
+                self.assertEqual(zf_out.read(name), data)
+
+    def test_errors(self):
+        with ZipFile(self.path_1) as zf_in, \
+                ZipFile(self.path_2, 'w') as zf_out:
+            zinfo, data = read_raw_entry(zf_in, zf_in.getinfo('stored'))
+            with zf_out.open('open', 'w'):
+                with self.assertRaises(RuntimeError):
+                    write_raw_entry(zf_out, zinfo, data)
+            zinfo = zf_in.getinfo('deflated')
+            zinfo.flag_bits |= 0x1
+            with self.assertRaises(RuntimeError):
+                read_raw_entry(zf_in, zinfo)
+
+
+class WebAnnoProjectWriterTest(unittest.TestCase):
+
+    SOURCES = [
+        ('doc1', b'#FORMAT=WebAnno TSV 3.2\n' * 100),
+        ('doc2', 'äöå\n'.encode('utf-8'))
+    ]
+
+    def test_write(self):
+        for store in (False, True):
+            with tempfile.TemporaryDirectory() as tmpdir:
+                path = os.path.join(tmpdir, 'project.zip')
+                template = { 'name' : None, 'description' : 'test' }
+                with WebAnnoProjectWriter(path, 'Test', template,
+                                          store=store) as writer:
+                    for name, data in self.SOURCES:
+                        writer.write(name, data)
+                with ZipFile(path) as zf:
+                    self.assertIsNone(zf.testzip())
+                    self.assertEqual(
+                        zf.namelist(),
+                        ['source/doc1', 'source/doc2',
+                         'exportedproject.json'])
+                    for name, data in self.SOURCES:
+                        self.assertEqual(zf.read('source/' + name), data)
+                    project = json.loads(zf.read('exportedproject.json'))
+                self.assertEqual(project['name'], 'Test')
+                self.assertEqual(project['description'], 'test')
+                self.assertEqual(
+                    [s['name'] for s in project['source_documents']],
+                    ['doc1', 'doc2'])
+
+    def test_copy(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path_1 = os.path.join(tmpdir, 'project-1.zip')
+            path_2 = os.path.join(tmpdir, 'project-2.zip')
+            with WebAnnoProjectWriter(path_1, 'Test', {}) as writer:
+                for name, data in self.SOURCES:
+                    writer.write(name, data)
+            with ZipFile(path_1) as zf, \
+                    WebAnnoProjectWriter(path_2, 'Test', {}) as writer:
+                writer.copy('doc2', zf, zf.getinfo('source/doc2'))
+                writer.write('doc3', b'new')
+            with ZipFile(path_2) as zf:
+                self.assertIsNone(zf.testzip())
+                self.assertEqual(zf.read('source/doc2'), self.SOURCES[1][1])
+                self.assertEqual(zf.read('source/doc3'), b'new')
+                project = json.loads(zf.read('exportedproject.json'))
+            self.assertEqual(
+                [s['name'] for s in project['source_documents']],
+                ['doc2', 'doc3'])
@@ -210,6 +210,21 @@ class WebAnnoTSVReaderTest(unittest.TestCase):
         self.assertEqual('#Text=' + str(doc.sentences[2]) + ' ', lines[36])
         self.assertEqual('#Text=' + str(doc.sentences[3]), lines[56])
 
+    def test_read_layers(self):
+        doc = WebAnnoTSVReader({'Quote', 'Metaphor'})\
+              .read(io.StringIO(self.TEST_DOC))
+        self.assertEqual(
+            [layer for layer, features in doc.schema], ['Quote', 'Metaphor'])
+        self.assertEqual(set(doc.annotations), {'Quote', 'Metaphor'})
+        full_doc = WebAnnoTSVReader().read(io.StringIO(self.TEST_DOC))
+        for layer in ('Quote', 'Metaphor'):
+            self.assertEqual(doc.annotations[layer],
+                             full_doc.annotations[layer])
+        self.assertEqual(
+            [str(s) for s in doc.sentences],
+            [str(s) for s in full_doc.sentences])
+        self.assertEqual(doc.sentences[0].tokens[0].annotations, {})
+
 class WebAnnoTSVReadWriteTest(unittest.TestCase):
 
     TEST_DOC = \
@@ -0,0 +1,55 @@
+import os
+import os.path
+import pstats
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from flopo_formats.profiling import \
+    profiled, PROFILE_ENV_VAR, PROFILE_MEMORY_ENV_VAR
+
+
+@profiled
+def _main(n):
+    return sum(range(n))
+
+
+class ProfiledTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'run.prof')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _run(self, argv, env={}):
+        with patch('sys.argv', ['flopo-test'] + argv), \
+                patch.dict(os.environ, env):
+            # ignore the variables possibly set in the environment
+            for var in (PROFILE_ENV_VAR, PROFILE_MEMORY_ENV_VAR):
+                if var not in env:
+                    os.environ.pop(var, None)
+            return _main(100)
+
+    def test_no_profile(self):
+        self.assertEqual(self._run([]), 4950)
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+
+    def test_profile(self):
+        self.assertEqual(
+            self._run(['--profile', self.path, '--profile-memory']), 4950)
+        self.assertTrue(os.path.isfile(self.path))
+        self.assertIn('_main', str(pstats.Stats(self.path).stats))
+        with open(self.path + '.mem.txt') as fp:
+            self.assertTrue(fp.read().startswith('peak traced memory:'))
+
+    def test_env(self):
+        for value, enabled in (('1', True), ('yes', True), ('0', False),
+                               ('false', False)):
+            self._run([], { PROFILE_ENV_VAR : self.path,
+                            PROFILE_MEMORY_ENV_VAR : value })
+            self.assertTrue(os.path.isfile(self.path))
+            self.assertEqual(os.path.isfile(self.path + '.mem.txt'), enabled)
+            for f in os.listdir(self.tmpdir.name):
+                os.remove(os.path.join(self.tmpdir.name, f))
@@ -0,0 +1,83 @@
+import json
+import os
+import os.path
+import tempfile
+import unittest
+from unittest.mock import patch
+from zipfile import ZipFile
+
+from flopo_formats.scripts.convert import main
+
+
+class ConvertZipTest(unittest.TestCase):
+
+    TEST_DOC = \
+'''#FORMAT=WebAnno TSV 3.2
+
+
+#Text={}
+1-1	0-3	Hei	
+1-2	4-{}	{}	
+'''
+
+    WORDS = ['maailma', 'kaikki']
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.input_file = self._path('export.zip')
+        self.template_file = self._path('template.json')
+        self.docs = {}
+        with ZipFile(self.input_file, 'w') as zf:
+            for i, word in enumerate(self.WORDS):
+                doc = self.TEST_DOC.format(
+                    'Hei ' + word, 4+len(word), word)
+                self.docs['doc{:02}'.format(i)] = doc
+                zf.writestr('source/doc{:02}.tsv'.format(i), doc)
+                zf.writestr(
+                    'annotation/doc{:02}.tsv/alice.tsv'.format(i), doc)
+        with open(self.template_file, 'w+') as fp:
+            json.dump({ 'name' : None }, fp)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def _run(self, *args):
+        with patch('sys.argv', ['flopo-convert', '-f', 'webanno-tsv'] \
+                               + list(args)):
+            main()
+
+    def _read_dir(self, path):
+        result = {}
+        for filename in os.listdir(path):
+            with open(os.path.join(path, filename)) as fp:
+                result[filename] = fp.read()
+        return result
+
+    def test_to_dir(self):
+        os.mkdir(self._path('out'))
+        self._run('-t', 'webanno-tsv', '-i', self.input_file,
+                  '-o', self._path('out'))
+        self.assertEqual(self._read_dir(self._path('out')), self.docs)
+
+    def test_to_project(self):
+        self._run('-t', 'webanno-project', '-i', self.input_file,
+                  '-o', self._path('project.zip'),
+                  '--template-file', self.template_file)
+        with ZipFile(self._path('project.zip')) as zf:
+            self.assertEqual(
+                sorted(zf.namelist()),
+                ['exportedproject.json', 'source/doc00', 'source/doc01'])
+        # converting the project back gives the same documents
+        os.mkdir(self._path('out'))
+        self._run('-t', 'webanno-tsv', '-i', self._path('project.zip'),
+                  '-o', self._path('out'))
+        self.assertEqual(self._read_dir(self._path('out')), self.docs)
+
+    def test_annotations(self):
+        os.mkdir(self._path('out'))
+        self._run('-t', 'webanno-tsv', '-i', self.input_file,
+                  '-o', self._path('out'), '--include', 'annotation/*')
+        self.assertEqual(self._read_dir(self._path('out')), self.docs)
@@ -0,0 +1,577 @@
+from array import array
+from collections import Counter
+import contextlib
+import io
+from itertools import groupby
+import os.path
+import random
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from flopo_formats.data import Annotation
+from flopo_formats.scripts.eval import \
+    annotation_spans, approximate_randomization, bootstrap_ci, \
+    compare_annotations, compare_spans_lenient, \
+    compare_spans_strict, label_annotations, label_segments, LabelIndex, \
+    main, non_punct_counts, sentence_offsets, unfold_annotations
+
+
+CORPUS = \
+'''articleId,paragraphId,sentenceId,wordId,word,lemma,upos,xpos,feats,head,deprel,misc
+d1,1,1,1,Mikko,Mikko,PROPN,N,,3,nsubj,
+d1,1,1,2,Virtanen,Virtanen,PROPN,N,,1,flat:name,
+d1,1,1,3,asuu,asua,VERB,V,,0,root,
+d1,1,1,4,Turussa,Turku,PROPN,N,,3,obl,SpaceAfter=No
+d1,1,1,5,.,.,PUNCT,Punct,,3,punct,
+d1,1,2,1,Hän,hän,PRON,Pron,,5,nsubj,
+d1,1,2,2,on,olla,AUX,V,,5,cop,
+d1,1,2,3,Nokia,Nokia,PROPN,N,,4,flat:name,
+d1,1,2,4,Oyj:n,Oyj,PROPN,N,,5,nmod:poss,
+d1,1,2,5,johtaja,johtaja,NOUN,N,,0,root,SpaceAfter=No
+d1,1,2,6,.,.,PUNCT,Punct,,5,punct,
+'''
+
+GOLD = \
+'''articleId,sentenceId,startWordId,endWordId,value
+d1,1,1,2,PER
+d1,1,4,4,LOC
+d1,2,3,4,ORG
+'''
+
+# - PER only partially found,
+# - LOC extends over the full stop,
+# - ORG tagged as LOC.
+SYSTEM = \
+'''articleId,sentenceId,startWordId,endWordId,value
+d1,1,1,1,PER
+d1,1,4,5,LOC
+d1,2,3,4,LOC
+'''
+
+
+class EvalTestCase(unittest.TestCase):
+    '''
+    Runs flopo-eval on files created in a temporary directory and parses
+    the printed scores.
+    '''
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.files = {}
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w+') as fp:
+            fp.write(content)
+        self.files[name] = path
+        return path
+
+    def _run(self, *args):
+        output = io.StringIO()
+        with patch('sys.argv', ['flopo-eval'] + list(args)), \
+                contextlib.redirect_stdout(output):
+            main()
+        return output.getvalue()
+
+    def _scores(self, output):
+        'Parse the score lines: key -> (TP, FP, FN, pre, rec, fsc).'
+        result = {}
+        for line in output.strip().split('\n'):
+            values = line.split()
+            result[' '.join(values[:-6])] = \
+                tuple(map(int, values[-6:-3])) \
+                + tuple(map(float, values[-3:]))
+        return result
+
+    def assertScores(self, scores, expected):
+        self.assertEqual(set(scores), set(expected))
+        for key, values in expected.items():
+            self.assertEqual(scores[key][:3], values[:3], key)
+            for x, y in zip(scores[key][3:], values[3:]):
+                self.assertAlmostEqual(x, y, msg=key)
+
+
+class TokenEvalTest(EvalTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._write('corpus.csv', CORPUS)
+        self._write('gold.csv', GOLD)
+        self._write('system.csv', SYSTEM)
+
+    def _eval(self, *args):
+        return self._scores(self._run(
+            '-i', self.files['system.csv'], '-g', self.files['gold.csv'],
+            '-c', self.files['corpus.csv'], '-r', 'short', *args))
+
+    def test_feature(self):
+        self.assertScores(
+            self._eval('-f', 'value'),
+            { 'PER' : (1, 0, 1, 1.0, 0.5, 2/3),
+              'LOC' : (1, 3, 0, 0.25, 1.0, 0.4),
+              'ORG' : (0, 0, 2, 0.0, 0.0, 0.0) })
+
+    def test_exclude_punct(self):
+        self.assertScores(
+            self._eval('-f', 'value', '--exclude-punct'),
+            { 'PER' : (1, 0, 1, 1.0, 0.5, 2/3),
+              'LOC' : (1, 2, 0, 1/3, 1.0, 0.5),
+              'ORG' : (0, 0, 2, 0.0, 0.0, 0.0) })
+
+    def test_no_feature(self):
+        self.assertScores(
+            self._eval(), { 'True' : (4, 1, 1, 0.8, 0.8, 0.8) })
+        self.assertScores(
+            self._eval('--exclude-punct'),
+            { 'True' : (4, 0, 1, 1.0, 0.8, 8/9) })
+
+
+class LabelTest(unittest.TestCase):
+
+    # two sentences of 5 and 6 tokens
+    DOC = [[('a', 'NOUN')] * 4 + [('.', 'PUNCT')],
+           [('b', 'NOUN')] * 5 + [('.', 'PUNCT')]]
+
+    def test_label_index(self):
+        labels = LabelIndex()
+        self.assertEqual(labels.code(None), 0)
+        self.assertEqual(labels.code('PER'), 1)
+        self.assertEqual(labels.code('LOC'), 2)
+        self.assertEqual(labels.code('PER'), 1)
+        self.assertEqual(labels[2], 'LOC')
+        self.assertIsNone(labels[0])
+        self.assertEqual(len(labels), 3)
+
+    def test_unfold(self):
+        offsets = sentence_offsets(self.DOC)
+        self.assertEqual(list(offsets), [0, 5, 11])
+        anns = [Annotation(1, 2, 1, 3, { 'value' : 'A' }),
+                # overlaps the previous one -- takes precedence
+                Annotation(1, 3, 1, 4, { 'value' : 'B' }),
+                # crosses the sentence boundary
+                Annotation(1, 5, 2, 1, { 'value' : 'A' }),
+                # exceeds the sentence length -- truncated
+                Annotation(2, 5, 2, 9, { 'value' : 'C' }),
+                # outside of the document -- ignored
+                Annotation(3, 1, 3, 1, { 'value' : 'C' })]
+        idx = unfold_annotations(offsets, anns)
+        self.assertEqual(list(idx), [-1, 0, 1, 1, 2, 2, -1, -1, -1, 3, 3])
+        labels = LabelIndex()
+        self.assertEqual(
+            [labels[x] for x in \
+             label_annotations(idx, anns, 'value', labels)],
+            [None, 'A', 'B', 'B', 'A', 'A', None, None, None, 'C', 'C'])
+
+    def test_compare(self):
+        src = [(0, 2, 1), (3, 5, 2), (7, 9, 1)]
+        tgt = [(1, 2, 1), (2, 5, 2), (8, 11, 3)]
+        self.assertEqual(
+            compare_annotations(src, tgt),
+            Counter({ (1, 0) : 2, (1, 1) : 1, (0, 2) : 1, (2, 2) : 2,
+                      (1, 3) : 1, (0, 3) : 2 }))
+        # the tokens 4 and 10 are punctuation
+        counts = non_punct_counts(self.DOC)
+        self.assertEqual(list(counts), [0, 1, 2, 3, 4, 4, 5, 6, 7, 8, 9, 9])
+        self.assertEqual(
+            compare_annotations(src, tgt, counts),
+            Counter({ (1, 0) : 2, (1, 1) : 1, (0, 2) : 1, (2, 2) : 1,
+                      (1, 3) : 1, (0, 3) : 1 }))
+
+    def test_segments(self):
+        'The label segments give the same results as the label arrays.'
+        rng = random.Random(0)
+        offsets = sentence_offsets(self.DOC)
+        for n in range(200):
+            # two lists of random (possibly overlapping) annotations
+            anns = [[], []]
+            for a in anns:
+                for k in range(rng.randint(0, 4)):
+                    s_id, start = rng.randint(1, 2), rng.randint(1, 6)
+                    a.append(Annotation(
+                        s_id, start, s_id, start+rng.randint(0, 3),
+                        { 'value' : rng.choice('AB') }))
+            labels = LabelIndex()
+            arrays = [label_annotations(unfold_annotations(offsets, a), a,
+                                        'value', labels) for a in anns]
+            expected = Counter(
+                (x, y) for x, y in zip(*arrays) if x or y)
+            segments = [label_segments(annotation_spans(
+                             offsets, a, 'value', labels)) for a in anns]
+            self.assertEqual(compare_annotations(*segments), expected)
+
+
+class SpanEvalTest(EvalTestCase):
+
+    def _compare(self, src, tgt):
+        return (compare_spans_strict(src, tgt),
+                compare_spans_lenient(src, tgt))
+
+    def test_exact(self):
+        spans = [(0, 2, 1), (3, 5, 1), (6, 7, 2)]
+        strict, lenient = self._compare(spans, spans)
+        self.assertEqual(strict, { 1 : (2, 0, 0), 2 : (1, 0, 0) })
+        self.assertEqual(lenient, strict)
+
+    def test_partial_overlap(self):
+        src = [(0, 2, 1), (3, 5, 1), (6, 7, 2)]
+        tgt = [(0, 2, 1), (3, 6, 1), (6, 7, 1)]
+        strict, lenient = self._compare(src, tgt)
+        self.assertEqual(strict, { 1 : (1, 1, 2), 2 : (0, 1, 0) })
+        # the label must match also in the lenient mode
+        self.assertEqual(lenient, { 1 : (2, 0, 1), 2 : (0, 1, 0) })
+
+    def test_off_by_one(self):
+        # adjacent spans don't overlap (the end is exclusive)
+        self.assertEqual(
+            self._compare([(2, 4, 1)], [(4, 6, 1)]),
+            ({ 1 : (0, 1, 1) }, { 1 : (0, 1, 1) }))
+        self.assertEqual(
+            self._compare([(2, 5, 1)], [(4, 6, 1)]),
+            ({ 1 : (0, 1, 1) }, { 1 : (1, 0, 0) }))
+        self.assertEqual(
+            self._compare([(4, 6, 1)], [(4, 7, 1)]),
+            ({ 1 : (0, 1, 1) }, { 1 : (1, 0, 0) }))
+
+    def test_match_once(self):
+        # one system span overlapping two gold spans
+        self.assertEqual(
+            compare_spans_lenient([(0, 10, 1)], [(1, 3, 1), (5, 7, 1)]),
+            { 1 : (1, 0, 1) })
+        # two system spans overlapping one gold span
+        self.assertEqual(
+            compare_spans_lenient([(0, 2, 1), (1, 5, 1)], [(1, 4, 1)]),
+            { 1 : (1, 1, 0) })
+        # the second system span gets the remaining gold span
+        self.assertEqual(
+            compare_spans_lenient([(0, 3, 1), (2, 6, 1)],
+                                  [(1, 3, 1), (2, 5, 1)]),
+            { 1 : (2, 0, 0) })
+        # duplicate spans
+        self.assertEqual(
+            self._compare([(1, 3, 1), (1, 3, 1)], [(1, 3, 1)]),
+            ({ 1 : (1, 1, 0) }, { 1 : (1, 1, 0) }))
+        # a short system span nested in a long one doesn't match the gold
+        # spans after its end
+        self.assertEqual(
+            compare_spans_lenient([(0, 10, 1), (1, 2, 1)],
+                                  [(3, 4, 1), (8, 9, 1)]),
+            { 1 : (1, 1, 1) })
+
+    def test_lenient(self):
+        'The lenient matching gives the same results as a brute force one.'
+
+        def _brute_force(src_spans, tgt_spans):
+            results = {}
+            for label in set(l for _, _, l in src_spans + tgt_spans):
+                src = sorted(s[:2] for s in src_spans if s[2] == label)
+                tgt = sorted(s[:2] for s in tgt_spans if s[2] == label)
+                matched, tp = set(), 0
+                for start, end in src:
+                    for k, (tgt_start, tgt_end) in enumerate(tgt):
+                        if k not in matched and tgt_start < end \
+                                and tgt_end > start:
+                            matched.add(k)
+                            tp += 1
+                            break
+                results[label] = (tp, len(src)-tp, len(tgt)-tp)
+            return results
+
+        rng = random.Random(0)
+        for n in range(500):
+            spans = [[], []]
+            for s in spans:
+                for k in range(rng.randint(0, 6)):
+                    start = rng.randint(0, 15)
+                    s.append((start, start+rng.randint(1, 8),
+                              rng.randint(1, 2)))
+            self.assertEqual(compare_spans_lenient(*spans),
+                             _brute_force(*spans))
+
+    def test_sentence_boundaries(self):
+        # two sentences of 5 and 6 tokens
+        offsets = sentence_offsets([[('a', 'NOUN')] * 5, [('b', 'NOUN')] * 6])
+        labels = LabelIndex()
+
+        def _spans(*anns):
+            return annotation_spans(
+                offsets, [Annotation(*a, { 'value' : 'Q' }) for a in anns],
+                'value', labels)
+
+        gold = _spans((1, 4, 2, 2))
+        self.assertEqual(gold, [(3, 7, 1)])
+        self.assertEqual(
+            self._compare(_spans((1, 4, 2, 2)), gold),
+            ({ 1 : (1, 0, 0) }, { 1 : (1, 0, 0) }))
+        # ends at the sentence end
+        self.assertEqual(
+            self._compare(_spans((1, 4, 1, 5)), gold),
+            ({ 1 : (0, 1, 1) }, { 1 : (1, 0, 0) }))
+        # starts in the next sentence
+        self.assertEqual(
+            self._compare(_spans((2, 1, 2, 6)), gold),
+            ({ 1 : (0, 1, 1) }, { 1 : (1, 0, 0) }))
+        # ends before the gold span
+        self.assertEqual(
+            self._compare(_spans((1, 1, 1, 3)), gold),
+            ({ 1 : (0, 1, 1) }, { 1 : (0, 1, 1) }))
+
+    def test_main(self):
+        output = self._run(
+            '-i', self._write('system.csv', SYSTEM),
+            '-g', self._write('gold.csv', GOLD),
+            '-c', self._write('corpus.csv', CORPUS),
+            '-r', 'short', '-f', 'value', '-s', 'strict', 'lenient')
+        scores = self._scores(output)
+        self.assertScores(
+            { key: value for key, value in scores.items() \
+              if key.startswith('strict ') },
+            { 'strict PER' : (0, 1, 1, 0.0, 0.0, 0.0),
+              'strict LOC' : (0, 2, 1, 0.0, 0.0, 0.0),
+              'strict ORG' : (0, 0, 1, 0.0, 0.0, 0.0) })
+        self.assertScores(
+            { key: value for key, value in scores.items() \
+              if key.startswith('lenient ') },
+            { 'lenient PER' : (1, 0, 0, 1.0, 1.0, 1.0),
+              'lenient LOC' : (1, 1, 0, 0.5, 1.0, 2/3),
+              'lenient ORG' : (0, 0, 1, 0.0, 0.0, 0.0) })
+
+
+class SortedEvalTest(EvalTestCase):
+
+    # the documents d1 and d2 both start with sentence 1, so they must
+    # not be merged
+    CORPUS = \
+'''articleId,paragraphId,sentenceId,wordId,word,lemma,upos,xpos,feats,head,deprel,misc
+d1,1,1,1,Mikko,Mikko,PROPN,N,,2,nsubj,
+d1,1,1,2,asuu,asua,VERB,V,,0,root,
+d1,1,1,3,Turussa,Turku,PROPN,N,,2,obl,
+d2,1,1,1,Nokia,Nokia,PROPN,N,,2,nsubj,
+d2,1,1,2,kasvaa,kasvaa,VERB,V,,0,root,
+d2,1,2,1,Hei,hei,INTJ,Interj,,0,root,
+d3,1,1,1,Helsinki,Helsinki,PROPN,N,,0,root,
+d3,1,1,2,.,.,PUNCT,Punct,,1,punct,
+'''
+
+    GOLD = \
+'''articleId,sentenceId,startWordId,endWordId,value
+d1,1,1,1,PER
+d1,1,3,3,LOC
+d2,1,1,1,ORG
+d3,1,1,1,LOC
+'''
+
+    # no annotations in d3
+    SYSTEM = \
+'''articleId,sentenceId,startWordId,endWordId,value
+d1,1,1,1,PER
+d1,1,3,3,ORG
+d2,1,1,1,ORG
+d2,2,1,1,PER
+'''
+
+    def _unsorted(self, content):
+        'Reverse the order of the documents.'
+        lines = content.strip().split('\n')
+        docs = [list(doc_lines) for doc_id, doc_lines in \
+                groupby(lines[1:], lambda line: line.split(',')[0])]
+        return '\n'.join(lines[:1] + sum(reversed(docs), [])) + '\n'
+
+    def _eval(self, corpus, gold, system, *args):
+        return self._run(
+            '-i', self._write('system.csv', system),
+            '-g', self._write('gold.csv', gold),
+            '-c', self._write('corpus.csv', corpus), *args)
+
+    def test_sorted(self):
+        for args in (('-r', 'short', '-f', 'value', '-s', 'strict'),
+                     ('-r', 'long', '-f', 'value'),
+                     ('-r', 'csv', '--exclude-punct')):
+            output = self._eval(self.CORPUS, self.GOLD, self.SYSTEM, *args)
+            self.assertEqual(
+                self._eval(self.CORPUS, self.GOLD, self.SYSTEM,
+                           '--sorted', *args),
+                output)
+        self.assertScores(
+            self._scores(self._eval(
+                self.CORPUS, self.GOLD, self.SYSTEM, '--sorted',
+                '-r', 'short', '-f', 'value')),
+            { 'PER' : (1, 1, 0, 0.5, 1.0, 2/3),
+              'LOC' : (0, 0, 2, 0.0, 0.0, 0.0),
+              'ORG' : (1, 1, 0, 0.5, 1.0, 2/3) })
+
+    def test_unsorted(self):
+        # loaded into memory -- the order doesn't matter
+        self.assertEqual(
+            self._eval(self._unsorted(self.CORPUS), self._unsorted(self.GOLD),
+                       self._unsorted(self.SYSTEM), '-r', 'short'),
+            self._eval(self.CORPUS, self.GOLD, self.SYSTEM, '-r', 'short'))
+        for i in range(3):
+            files = [self.CORPUS, self.GOLD, self.SYSTEM]
+            files[i] = self._unsorted(files[i])
+            with self.assertRaisesRegex(RuntimeError, 'not sorted'):
+                self._eval(*files, '--sorted', '-r', 'short')
+
+    def test_numeric_order(self):
+        'The IDs are compared as strings: 1, 2, 10 is not sorted.'
+        def _renumber(content):
+            return content.replace('d1,', '1,').replace('d2,', '2,')\
+                          .replace('d3,', '10,')
+        files = [_renumber(f) for f in (self.CORPUS, self.GOLD, self.SYSTEM)]
+        with self.assertRaisesRegex(
+                RuntimeError,
+                'not sorted lexicographically by articleId:'
+                ' \'10\' after \'2\''):
+            self._eval(*files, '--sorted', '-r', 'short')
+
+
+class MultiEvalTest(EvalTestCase):
+
+    GOLD = \
+'''articleId,sentenceId,startWordId,endWordId,value,kind
+d1,1,1,2,PER,name
+d1,1,4,4,LOC,name
+d1,2,3,4,ORG,name
+'''
+
+    SYSTEM_1 = \
+'''articleId,sentenceId,startWordId,endWordId,value,kind
+d1,1,1,1,PER,name
+d1,1,4,5,LOC,name
+d1,2,3,4,LOC,name
+'''
+
+    SYSTEM_2 = \
+'''articleId,sentenceId,startWordId,endWordId,value,kind
+d1,1,1,2,PER,name
+d1,1,4,4,LOC,other
+d1,2,2,4,ORG,name
+'''
+
+    def setUp(self):
+        super().setUp()
+        self._write('corpus.csv', CORPUS)
+        self._write('gold.csv', self.GOLD)
+        self._write('system-1.csv', self.SYSTEM_1)
+        self._write('system-2.csv', self.SYSTEM_2)
+
+    def _eval(self, input_files, features, *args):
+        with patch('flopo_formats.scripts.eval.open', wraps=open,
+                   create=True) as mock_open:
+            output = self._run(
+                '-i', *(self.files[f] for f in input_files),
+                '-g', self.files['gold.csv'], '-c', self.files['corpus.csv'],
+                '-f', *features, '-r', 'short', '-s', 'strict', *args)
+        opened = [c.args[0] for c in mock_open.call_args_list]
+        return output, opened
+
+    def test_table(self):
+        for args in ((), ('--sorted',)):
+            inputs = ['system-1.csv', 'system-2.csv']
+            output, opened = self._eval(inputs, ['value', 'kind'], *args)
+            # each file is read only once
+            self.assertEqual(
+                sorted(opened), sorted(self.files[f] for f in self.files))
+            lines, n_matched = output.strip().split('\n'), 0
+            for input_file in inputs:
+                for feature in ('value', 'kind'):
+                    single_output, opened = \
+                        self._eval([input_file], [feature], *args)
+                    expected = []
+                    for line in single_output.strip().split('\n'):
+                        if not line.startswith('strict '):
+                            line = 'token ' + line
+                        expected.append(' '.join(
+                            (self.files[input_file], feature, line)))
+                    prefix = self.files[input_file] + ' ' + feature + ' '
+                    self.assertEqual(
+                        [line for line in lines if line.startswith(prefix)],
+                        expected)
+                    n_matched += len(expected)
+            self.assertEqual(n_matched, len(lines))
+
+
+class StatisticsTest(EvalTestCase):
+
+    def _doc_counts(self, rng, n, tp, fp, fn):
+        'Random per-document counts around the given means.'
+        return tuple(array('l', (rng.randint(0, 2*x) for i in range(n))) \
+                     for x in (tp, fp, fn))
+
+    def test_bootstrap(self):
+        rng = random.Random(0)
+        widths = []
+        for n in (10, 100, 1000):
+            doc_counts = self._doc_counts(rng, n, 5, 2, 3)
+            results = bootstrap_ci(doc_counts, 500, 0.95, random.Random(1))
+            self.assertEqual(len(results), 3)
+            for value, lower, upper in results:
+                self.assertLessEqual(lower, value)
+                self.assertLessEqual(value, upper)
+                self.assertLess(lower, upper)
+            widths.append(results[2][2] - results[2][1])
+        self.assertGreater(widths[0], widths[1])
+        self.assertGreater(widths[1], widths[2])
+
+    def test_bootstrap_seed(self):
+        doc_counts = self._doc_counts(random.Random(0), 50, 5, 2, 3)
+        self.assertEqual(
+            bootstrap_ci(doc_counts, 100, 0.9, random.Random(1)),
+            bootstrap_ci(doc_counts, 100, 0.9, random.Random(1)))
+
+    def test_identical_systems(self):
+        doc_counts = self._doc_counts(random.Random(0), 50, 5, 2, 3)
+        diff, p_value = approximate_randomization(
+            doc_counts, doc_counts, 1000, random.Random(1))
+        self.assertEqual(diff, 0)
+        self.assertAlmostEqual(p_value, 1.0)
+
+    def test_better_system(self):
+        rng = random.Random(0)
+        worse = self._doc_counts(rng, 50, 5, 5, 5)
+        better = self._doc_counts(rng, 50, 9, 1, 1)
+        diff, p_value = approximate_randomization(
+            worse, better, 1000, random.Random(1))
+        self.assertGreater(diff, 0.3)
+        self.assertLess(p_value, 0.01)
+        # the other way round, the difference is negative
+        diff, p_value = approximate_randomization(
+            better, worse, 1000, random.Random(1))
+        self.assertLess(diff, -0.3)
+        self.assertLess(p_value, 0.01)
+        # a small difference on few documents is not significant
+        a = self._doc_counts(rng, 5, 5, 5, 5)
+        b = tuple(array('l', (x + (i == 0) for i, x in enumerate(c))) \
+                  for c in a)
+        diff, p_value = approximate_randomization(
+            a, b, 1000, random.Random(1))
+        self.assertGreater(p_value, 0.5)
+
+    def test_main(self):
+        system = self._write('system.csv', SYSTEM)
+        output = self._run(
+            '-i', system, system, '-g', self._write('gold.csv', GOLD),
+            '-c', self._write('corpus.csv', CORPUS),
+            '--bootstrap', '100', '--significance', '100', '--seed', '1')
+        ci_lines = [line.split() for line in output.split('\n') \
+                    if line.startswith('CI ')]
+        self.assertEqual(len(ci_lines), 2)
+        for line in ci_lines:
+            self.assertEqual(line[1:4], [system, '-', 'token'])
+            # precision, recall and F-score of the single document
+            self.assertEqual(
+                list(map(float, line[4:])),
+                [0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8])
+        ar_lines = [line.split() for line in output.split('\n') \
+                    if line.startswith('AR ')]
+        self.assertEqual(
+            ar_lines, [['AR', system, system, '-', 'token', '0.0', '1.0']])
+        # the output is reproducible with the same seed
+        self.assertEqual(
+            self._run('-i', system, system, '-g', self.files['gold.csv'],
+                      '-c', self.files['corpus.csv'], '--bootstrap', '100',
+                      '--significance', '100', '--seed', '1'),
+            output)
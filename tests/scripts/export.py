@@ -0,0 +1,130 @@
+from contextlib import ExitStack, redirect_stdout
+import io
+import os
+import os.path
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from flopo_formats.scripts.export import main, open_output_files
+
+
+class ExportTest(unittest.TestCase):
+
+    HEADER = \
+'''#FORMAT=WebAnno TSV 3.2
+#T_SP=de.tudarmstadt.ukp.dkpro.core.api.ner.type.NamedEntity|value
+#T_SP=webanno.custom.Quote|value
+
+
+'''
+
+    DOCS = {
+        'doc1.tsv' : HEADER + \
+'''#Text=Mikko asuu Turussa.
+1-1	0-5	Mikko	EnamexPrsHum	x[1]	
+1-2	6-10	asuu	_	x[1]	
+1-3	11-18	Turussa	EnamexLocPpl	x[1]	
+1-4	18-19	.	_	x[1]	
+
+#Text=Hei
+2-1	20-23	Hei	_	x[1]	
+''',
+        'doc2.tsv' : HEADER + \
+'''#Text=Uusi lause
+1-1	0-4	Uusi	EnamexPrsHum[2]	_	
+1-2	5-10	lause	EnamexPrsHum[2]	_	
+'''
+    }
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.input_dir = self._path('input')
+        os.mkdir(self.input_dir)
+        for filename, text in self.DOCS.items():
+            with open(os.path.join(self.input_dir, filename), 'w+') as fp:
+                fp.write(text)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def _run(self, *args):
+        argv = ['flopo-export', '-I', self.input_dir] + list(args)
+        output = io.StringIO()
+        with patch('sys.argv', argv), redirect_stdout(output):
+            main()
+        return output.getvalue()
+
+    def _read(self, path):
+        with open(path) as fp:
+            return fp.read()
+
+    def test_single_layer(self):
+        self.assertEqual(
+            self._run('-a', 'NamedEntity'),
+            'articleId,startSentenceId,startWordId,endSentenceId,endWordId,'
+            'value\n'
+            'doc1,1,1,1,1,EnamexPrsHum\n'
+            'doc1,1,3,1,3,EnamexLocPpl\n'
+            'doc2,1,1,1,2,EnamexPrsHum\n')
+
+    def test_filter(self):
+        os.mkdir(os.path.join(self.input_dir, 'sub'))
+        os.rename(os.path.join(self.input_dir, 'doc1.tsv'),
+                  os.path.join(self.input_dir, 'sub', 'doc1.tsv'))
+        # the subdirectories are read in alphabetical order
+        self.assertEqual(
+            self._run('-a', 'NamedEntity').split('\n')[1:],
+            ['doc2,1,1,1,2,EnamexPrsHum', 'doc1,1,1,1,1,EnamexPrsHum',
+             'doc1,1,3,1,3,EnamexLocPpl', ''])
+        self.assertEqual(
+            self._run('-a', 'NamedEntity', '--exclude', 'sub/*')\
+                .split('\n')[1:],
+            ['doc2,1,1,1,2,EnamexPrsHum', ''])
+        self.assertEqual(
+            self._run('-a', 'NamedEntity', '--include', 'doc1.tsv')\
+                .split('\n')[1:],
+            ['doc1,1,1,1,1,EnamexPrsHum', 'doc1,1,3,1,3,EnamexLocPpl', ''])
+
+    def test_several_layers(self):
+        self._run('-a', 'NamedEntity', 'Quote',
+                  '-o', self._path('export-{layer}.csv'))
+        self.assertEqual(
+            sorted(os.listdir(self.tmpdir.name)),
+            ['export-NamedEntity.csv', 'export-Quote.csv', 'input'])
+        for layer in ('NamedEntity', 'Quote'):
+            self.assertEqual(
+                self._read(self._path('export-{}.csv'.format(layer))),
+                self._run('-a', layer))
+        self.assertEqual(
+            self._read(self._path('export-Quote.csv')),
+            'articleId,startSentenceId,startWordId,endSentenceId,endWordId,'
+            'value\n'
+            'doc1,1,1,2,1,x\n')
+
+    def test_several_layers_without_placeholder(self):
+        for args in ([], ['-o', '-'], ['-o', self._path('export.csv')]):
+            with self.assertRaises(RuntimeError):
+                self._run('-a', 'NamedEntity', 'Quote', *args)
+        self.assertEqual(os.listdir(self.tmpdir.name), ['input'])
+
+    def test_open_output_files(self):
+        layers = ['NamedEntity', 'Quote']
+        with ExitStack() as stack:
+            self.assertEqual(
+                open_output_files(stack, '-', layers),
+                { 'NamedEntity' : sys.stdout, 'Quote' : sys.stdout })
+            files = open_output_files(
+                stack, self._path('export.csv'), layers)
+            self.assertIs(files['NamedEntity'], files['Quote'])
+            files = open_output_files(
+                stack, self._path('{layer}.csv'), layers)
+            self.assertEqual(
+                [fp.name for fp in files.values()],
+                [self._path('NamedEntity.csv'), self._path('Quote.csv')])
+        # the files are closed with the stack
+        self.assertTrue(all(fp.closed for fp in files.values()))
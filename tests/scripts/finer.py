@@ -0,0 +1,114 @@
+import os.path
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from flopo_formats.scripts.finer import \
+    load_checkpoint, main, write_annotations, CHECKPOINT_SUFFIX
+from tests.wrappers.fake_tagger import FakeTagger
+
+
+class CheckpointTest(unittest.TestCase):
+
+    CORPUS = \
+'''articleId,paragraphId,sentenceId,wordId,word,lemma,upos,xpos,feats,head,deprel,misc
+doc1,1,1,1,Mikko,Mikko,PROPN,N,Case=Nom|Number=Sing,2,nsubj,
+doc1,1,1,2,asuu,asua,VERB,V,Mood=Ind,0,root,
+doc1,1,1,3,Turussa,Turku,PROPN,N,Case=Ine|Number=Sing,2,obl,
+doc2,1,1,1,Hei,hei,INTJ,Interj,,0,root,
+doc2,1,2,1,Uusi,uusi,ADJ,A,Case=Nom|Degree=Pos|Number=Sing,2,amod,
+doc2,1,2,2,lause,lause,NOUN,N,Case=Nom|Number=Sing,0,root,
+doc3,1,1,1,Pekka,Pekka,PROPN,N,Case=Nom|Number=Sing,0,root,
+'''
+
+    ANNOTATIONS = \
+'''articleId,sentenceId,startWordId,endWordId,value
+doc1,1,1,1,EnamexPrsHum
+doc1,1,3,3,EnamexPrsHum
+doc2,1,1,1,EnamexPrsHum
+doc2,2,1,1,EnamexPrsHum
+doc3,1,1,1,EnamexPrsHum
+'''
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.input_file = os.path.join(self.tmpdir.name, 'corpus.csv')
+        self.output_file = os.path.join(self.tmpdir.name, 'finer.csv')
+        self.checkpoint_file = self.output_file + CHECKPOINT_SUFFIX
+        with open(self.input_file, 'w+') as fp:
+            fp.write(self.CORPUS)
+        self.tagger = FakeTagger()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _run(self, *args):
+        argv = ['flopo-finer', '-i', self.input_file, '-o', self.output_file]
+        argv.extend(args)
+        with patch('sys.argv', argv), \
+                patch('flopo_formats.scripts.finer._annotate_docs',
+                      self.tagger.annotate_docs):
+            main()
+
+    def _read(self, path):
+        with open(path) as fp:
+            return fp.read()
+
+    def _checkpoint(self, doc_ids):
+        'The expected checkpoint after completing `doc_ids`.'
+        lines = self.ANNOTATIONS.split('\n')
+        result, offset = [], len(lines[0])+1
+        for doc_id in doc_ids:
+            for line in lines[1:]:
+                if line.startswith(doc_id + ','):
+                    offset += len(line)+1
+            result.append('{}\t{}\n'.format(doc_id, offset))
+        return ''.join(result)
+
+    def test_run(self):
+        self._run()
+        self.assertEqual(self._read(self.output_file), self.ANNOTATIONS)
+        self.assertEqual(
+            self._read(self.checkpoint_file),
+            self._checkpoint(['doc1', 'doc2', 'doc3']))
+        self.assertEqual(len(self.tagger.tagged), 4)
+
+    def test_load_checkpoint(self):
+        self.assertEqual(load_checkpoint(self.output_file), (set(), None))
+        write_annotations(
+            [('doc1', [(1, 1, 1, 'EnamexPrsHum'), (1, 3, 3, 'EnamexPrsHum')])],
+            self.output_file)
+        size = os.path.getsize(self.output_file)
+        self.assertEqual(load_checkpoint(self.output_file), ({'doc1'}, size))
+        # an incomplete last line is ignored
+        with open(self.checkpoint_file, 'a') as fp:
+            fp.write('doc2\t1')
+        self.assertEqual(load_checkpoint(self.output_file), ({'doc1'}, size))
+
+    def test_resume(self):
+        # simulate a run interrupted while writing doc2 and its checkpoint
+        write_annotations(
+            [('doc1', [(1, 1, 1, 'EnamexPrsHum'), (1, 3, 3, 'EnamexPrsHum')])],
+            self.output_file)
+        with open(self.output_file, 'a') as fp:
+            fp.write('doc2,1,1,1,EnamexPrsHum\ndoc2,2,1')
+        with open(self.checkpoint_file, 'a') as fp:
+            fp.write('doc2\t9')
+        self._run('--resume')
+        self.assertEqual(self._read(self.output_file), self.ANNOTATIONS)
+        self.assertEqual(
+            self._read(self.checkpoint_file),
+            self._checkpoint(['doc1', 'doc2', 'doc3']))
+        # only the documents not completed before were tagged
+        self.assertEqual(
+            self.tagger.tagged, [['Hei'], ['Uusi', 'lause'], ['Pekka']])
+
+    def test_resume_completed(self):
+        self._run()
+        self.tagger.tagged = []
+        self._run('--resume')
+        self.assertEqual(self._read(self.output_file), self.ANNOTATIONS)
+        self.assertEqual(
+            self._read(self.checkpoint_file),
+            self._checkpoint(['doc1', 'doc2', 'doc3']))
+        self.assertEqual(self.tagger.tagged, [])
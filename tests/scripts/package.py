@@ -0,0 +1,160 @@
+import os.path
+from pathlib import Path
+import random
+import tempfile
+import unittest
+from unittest.mock import patch
+from zipfile import ZipFile
+
+from flopo_formats.io.webannoproject import compress_entry
+from flopo_formats.scripts.package import package, split_into_parts
+
+
+class SplitIntoPartsTest(unittest.TestCase):
+
+    def _check(self, sizes, parts, max_docs=None, max_bytes=None):
+        'Check that `parts` is a partition of `sizes` within the limits.'
+        self.assertEqual(sorted(j for p in parts for j in p),
+                         list(range(len(sizes))))
+        for p in parts:
+            self.assertEqual(p, sorted(p))
+            if max_docs is not None:
+                self.assertLessEqual(len(p), max_docs)
+            if max_bytes is not None and len(p) > 1:
+                self.assertLessEqual(sum(sizes[j] for j in p), max_bytes)
+
+    def test_max_docs(self):
+        sizes = [1] * 10
+        parts = split_into_parts(sizes, max_docs=3)
+        self._check(sizes, parts, max_docs=3)
+        self.assertEqual(len(parts), 4)
+        self.assertEqual(split_into_parts(sizes, max_docs=10),
+                         [list(range(10))])
+
+    def test_max_bytes(self):
+        sizes = [5, 4, 3, 3, 2, 1]
+        parts = split_into_parts(sizes, max_bytes=6)
+        self._check(sizes, parts, max_bytes=6)
+        self.assertEqual(len(parts), 3)
+        # the greedy packing misses the split [3, 3], [2, 2, 2]
+        # and adds a part instead
+        sizes = [3, 3, 2, 2, 2]
+        parts = split_into_parts(sizes, max_bytes=6)
+        self._check(sizes, parts, max_bytes=6)
+        self.assertEqual(len(parts), 3)
+
+    def test_large_file(self):
+        sizes = [1, 10, 1]
+        parts = split_into_parts(sizes, max_bytes=5)
+        self._check(sizes, parts, max_bytes=5)
+        self.assertEqual(parts, [[1], [0], [2]])
+        self.assertEqual(split_into_parts([10], max_bytes=5), [[0]])
+
+    def test_both_limits(self):
+        sizes = [4, 1, 1, 1, 1, 1, 1]
+        parts = split_into_parts(sizes, max_docs=3, max_bytes=5)
+        self._check(sizes, parts, max_docs=3, max_bytes=5)
+        self.assertEqual(len(parts), 3)
+
+    def test_balance(self):
+        rng = random.Random(1)
+        for i in range(20):
+            sizes = [rng.randrange(1, 1000) for j in range(rng.randrange(50))]
+            parts = split_into_parts(sizes, max_docs=10, max_bytes=5000)
+            self._check(sizes, parts, max_docs=10, max_bytes=5000)
+            if parts:
+                totals = [sum(sizes[j] for j in p) for p in parts]
+                self.assertLessEqual(max(totals) - min(totals), max(sizes))
+
+    def test_empty(self):
+        self.assertEqual(split_into_parts([]), [])
+        self.assertEqual(split_into_parts([], max_docs=2, max_bytes=10), [])
+
+
+class PackageTest(unittest.TestCase):
+
+    FILES = {
+        'doc1.tsv' : b'#FORMAT=WebAnno TSV 3.2\n' * 100,
+        'doc2.tsv' : 'äöå\n'.encode('utf-8'),
+        'doc3.tsv' : b'',
+        'doc4.tsv' : b'Mikko asuu Turussa\n' * 10
+    }
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.corpus_dir = Path(self.tmpdir.name) / 'corpus'
+        self.corpus_dir.mkdir()
+        self.output_file = os.path.join(self.tmpdir.name, 'project.zip')
+        for name, data in self.FILES.items():
+            (self.corpus_dir / name).write_bytes(data)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _read(self, path):
+        with ZipFile(path) as zf:
+            self.assertIsNone(zf.testzip())
+            return { zinfo.filename : zf.read(zinfo) \
+                     for zinfo in zf.infolist() \
+                     if zinfo.filename.startswith('source/') }
+
+    def test_parts(self):
+        package(self.corpus_dir, 'Test', {}, self.output_file, jobs=2,
+                max_docs=2)
+        base = os.path.join(self.tmpdir.name, 'project')
+        self.assertEqual(
+            sorted(os.listdir(self.tmpdir.name)),
+            ['corpus', 'project.1.zip', 'project.2.zip'])
+        contents = {}
+        for i in (1, 2):
+            part = self._read('{}.{}.zip'.format(base, i))
+            self.assertEqual(len(part), 2)
+            contents.update(part)
+        self.assertEqual(
+            contents,
+            { 'source/' + name : data for name, data in self.FILES.items() })
+
+    def test_empty(self):
+        for name in self.FILES:
+            (self.corpus_dir / name).unlink()
+        with self.assertLogs(level='WARNING'):
+            package(self.corpus_dir, 'Test', {}, self.output_file, jobs=2,
+                    max_docs=2)
+        self.assertEqual(os.listdir(self.tmpdir.name), ['corpus'])
+
+    def test_update(self):
+        package(self.corpus_dir, 'Test', {}, self.output_file, jobs=2)
+        with ZipFile(self.output_file) as zf:
+            old_infos = { zinfo.filename : zinfo for zinfo in zf.infolist() }
+        (self.corpus_dir / 'doc2.tsv').write_bytes(b'changed\n')
+        (self.corpus_dir / 'doc4.tsv').unlink()
+        (self.corpus_dir / 'doc5.tsv').write_bytes(b'new\n')
+        with patch('os.replace', wraps=os.replace) as replace, \
+                patch('flopo_formats.io.webannoproject.compress_entry',
+                      wraps=compress_entry) as compress, \
+                self.assertLogs(level='INFO') as logs:
+            package(self.corpus_dir, 'Test', {}, self.output_file, jobs=2,
+                    update=True)
+        replace.assert_called_once_with(
+            self.output_file + '.tmp', self.output_file)
+        self.assertFalse(os.path.exists(self.output_file + '.tmp'))
+        self.assertIn(
+            'Updated {}: 2 unchanged files copied, 2 files compressed,'
+            ' 1 files removed.'.format(self.output_file),
+            [r.getMessage() for r in logs.records])
+        # only the changed and new files were compressed
+        self.assertEqual(
+            sorted(c.args[0].filename for c in compress.call_args_list),
+            ['source/doc2.tsv', 'source/doc5.tsv'])
+        self.assertEqual(
+            self._read(self.output_file),
+            { 'source/doc1.tsv' : self.FILES['doc1.tsv'],
+              'source/doc2.tsv' : b'changed\n',
+              'source/doc3.tsv' : b'',
+              'source/doc5.tsv' : b'new\n' })
+        with ZipFile(self.output_file) as zf:
+            for name in ('source/doc1.tsv', 'source/doc3.tsv'):
+                zinfo = zf.getinfo(name)
+                for attr in ('CRC', 'compress_size', 'date_time'):
+                    self.assertEqual(getattr(zinfo, attr),
+                                     getattr(old_infos[name], attr))
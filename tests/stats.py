@@ -0,0 +1,75 @@
+import json
+import os.path
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from flopo_formats.scripts.convert import main as convert_main
+from flopo_formats.stats import Statistics
+
+
+class StatisticsTest(unittest.TestCase):
+
+    CORPUS = \
+'''articleId,paragraphId,sentenceId,wordId,word,lemma,upos,xpos,feats,head,deprel,misc
+doc1,1,1,1,Mikko,Mikko,PROPN,N,Case=Nom|Number=Sing,2,nsubj,
+doc1,1,1,2,asuu,asua,VERB,V,Mood=Ind,0,root,
+doc1,1,1,3,Turussa,Turku,PROPN,N,Case=Ine|Number=Sing,2,obl,SpaceAfter=No
+doc1,1,1,4,.,.,PUNCT,Punct,,2,punct,
+doc1,2,2,1,Hei,hei,INTJ,Interj,,0,root,
+doc2,1,1,1,Uusi,uusi,ADJ,A,Case=Nom|Degree=Pos|Number=Sing,2,amod,
+doc2,1,1,2,lause,lause,NOUN,N,Case=Nom|Number=Sing,0,root,
+'''
+
+    NAMED_ENTITIES = \
+'''articleId,sentenceId,startWordId,endWordId,value
+doc1,1,1,1,EnamexPrsHum
+doc1,1,3,3,EnamexLocPpl
+'''
+
+    def test_stage(self):
+        stats = Statistics()
+
+        def _docs():
+            for i in range(3):
+                time.sleep(0.01)
+                yield i
+
+        with stats.measure('write'):
+            for doc in stats.stage('read', _docs()):
+                pass
+        self.assertGreaterEqual(stats.wall['read'], 0.03)
+        self.assertLess(stats.wall['write'], stats.wall['read'])
+
+    def test_convert(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            corpus_file = os.path.join(tmpdir, 'corpus.csv')
+            ne_file = os.path.join(tmpdir, 'ne.csv')
+            stats_file = os.path.join(tmpdir, 'stats.json')
+            output_dir = os.path.join(tmpdir, 'out')
+            os.mkdir(output_dir)
+            with open(corpus_file, 'w+') as fp:
+                fp.write(self.CORPUS)
+            with open(ne_file, 'w+') as fp:
+                fp.write(self.NAMED_ENTITIES)
+            argv = ['flopo-convert', '-f', 'csv', '-t', 'webanno-tsv',
+                    '-i', corpus_file, '-o', output_dir,
+                    '--stats-json', stats_file,
+                    '-a', 'NamedEntity:' + ne_file]
+            with patch('sys.argv', argv):
+                convert_main()
+            with open(stats_file) as fp:
+                summary = json.load(fp)
+        self.assertEqual(
+            set(summary),
+            { 'documents', 'sentences', 'tokens', 'annotations', 'stages',
+              'total', 'docs_per_sec', 'tokens_per_sec' })
+        self.assertEqual(summary['documents'], 2)
+        self.assertEqual(summary['sentences'], 3)
+        self.assertEqual(summary['tokens'], 7)
+        self.assertEqual(summary['annotations'], { 'NamedEntity' : 2 })
+        self.assertEqual(
+            set(summary['stages']), { 'read', 'merge:NamedEntity', 'write' })
+        for t in summary['stages'].values():
+            self.assertEqual(set(t), { 'wall', 'cpu' })
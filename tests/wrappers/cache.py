@@ -0,0 +1,56 @@
+import os.path
+import tempfile
+import unittest
+
+from flopo_formats.wrappers.cache import annotate_docs_cached, SentenceCache
+from tests.wrappers.fake_tagger import FakeTagger
+
+
+class SentenceCacheTest(unittest.TestCase):
+
+    DOCS = [
+        ('doc1', [['Mikko', 'asuu', 'Turussa'], ['Hei', '.']]),
+        ('doc2', [['Hei', '.'], ['uusi', 'Lause']])
+    ]
+
+    RESULTS = [
+        ('doc1', [(1, 1, 1, 'EnamexPrsHum'), (1, 3, 3, 'EnamexPrsHum'),
+                  (2, 1, 1, 'EnamexPrsHum')]),
+        ('doc2', [(1, 1, 1, 'EnamexPrsHum'), (2, 2, 2, 'EnamexPrsHum')])
+    ]
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'cache.db')
+        self.tagger = FakeTagger()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _annotate(self, **kwargs):
+        with SentenceCache(self.path, **kwargs) as cache:
+            return list(annotate_docs_cached(
+                self.DOCS, self.tagger.annotate_docs, cache))
+
+    def test_cache(self):
+        self.assertEqual(self._annotate(), self.RESULTS)
+        self.assertEqual(
+            self.tagger.tagged,
+            [['Mikko', 'asuu', 'Turussa'], ['Hei', '.'], ['uusi', 'Lause']])
+        self.tagger.tagged = []
+        self.assertEqual(self._annotate(), self.RESULTS)
+        self.assertEqual(self.tagger.tagged, [])
+
+    def test_tagger_version(self):
+        self._annotate(tagger_version='1')
+        self.tagger.tagged = []
+        self.assertEqual(self._annotate(tagger_version='2'), self.RESULTS)
+        self.assertEqual(len(self.tagger.tagged), 3)
+
+    def test_eviction(self):
+        self._annotate(max_size=2)
+        with SentenceCache(self.path) as cache:
+            self.assertEqual(
+                cache.get([['Mikko', 'asuu', 'Turussa'], ['Hei', '.'],
+                           ['uusi', 'Lause']]),
+                [None, [(1, 1, 'EnamexPrsHum')], [(2, 2, 'EnamexPrsHum')]])
@@ -0,0 +1,51 @@
+import unittest
+
+from flopo_formats.wrappers.dedup import \
+    annotate_docs_deduplicated, FingerprintStore
+from tests.wrappers.fake_tagger import FakeTagger
+
+
+class DeduplicationTest(unittest.TestCase):
+
+    DOCS = [
+        ('doc1', [['Mikko', 'asuu', 'Turussa'], ['Hei', '.'], ['Hei', '.']]),
+        ('doc2', [['Hei', '.'], ['uusi', 'Lause']]),
+        ('doc3', [['Mikko', 'asuu', 'Turussa']])
+    ]
+
+    RESULTS = [
+        ('doc1', [(1, 1, 1, 'EnamexPrsHum'), (1, 3, 3, 'EnamexPrsHum'),
+                  (2, 1, 1, 'EnamexPrsHum'), (3, 1, 1, 'EnamexPrsHum')]),
+        ('doc2', [(1, 1, 1, 'EnamexPrsHum'), (2, 2, 2, 'EnamexPrsHum')]),
+        ('doc3', [(1, 1, 1, 'EnamexPrsHum'), (1, 3, 3, 'EnamexPrsHum')])
+    ]
+
+    def setUp(self):
+        self.tagger = FakeTagger()
+
+    def test_dedup(self):
+        for pipelined in (False, True):
+            self.tagger = FakeTagger()
+            annotate_docs = self.tagger.pipelined_annotate_docs \
+                            if pipelined else self.tagger.annotate_docs
+            store = FingerprintStore()
+            self.assertEqual(
+                list(annotate_docs_deduplicated(
+                    self.DOCS, annotate_docs, store)),
+                self.RESULTS)
+            self.assertEqual(
+                self.tagger.tagged,
+                [['Mikko', 'asuu', 'Turussa'], ['Hei', '.'],
+                 ['uusi', 'Lause']])
+            self.assertAlmostEqual(store.dedup_ratio(), 0.5)
+
+    def test_memory_budget(self):
+        store = FingerprintStore()
+        store.max_entries = 1
+        self.assertEqual(
+            list(annotate_docs_deduplicated(
+                self.DOCS, self.tagger.annotate_docs, store)),
+            self.RESULTS)
+        self.assertEqual(len(store.results), 1)
+        # only the second occurrence of the first sentence is tagged again
+        self.assertEqual(len(self.tagger.tagged), 4)
@@ -0,0 +1,18 @@
+class FakeTagger:
+    'A fake tagger marking capitalized tokens.'
+
+    def __init__(self):
+        self.tagged = []
+
+    def annotate_docs(self, docs):
+        'Tags the documents, recording the sentences in `tagged`.'
+        for doc_id, sentences in docs:
+            self.tagged.extend(sentences)
+            yield doc_id, [(s_id, t_id, t_id, 'EnamexPrsHum') \
+                           for s_id, s in enumerate(sentences, 1) \
+                           for t_id, t in enumerate(s, 1) \
+                           if t[0].isupper()]
+
+    def pipelined_annotate_docs(self, docs):
+        'Like `annotate_docs`, but reads all documents before tagging.'
+        return self.annotate_docs(list(docs))
@@ -0,0 +1,191 @@
+from collections import deque
+import email
+import http.server
+import os.path
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from flopo_formats.wrappers.adaptive import AdaptiveController
+from flopo_formats.wrappers.finer import \
+    annotate, FinerPool, FinerSession, RemoteFiner
+
+
+# A fake `finnish-nertag`: tags capitalized tokens as person names and
+# crashes on the token 'CRASH' if the file given as argument doesn't exist
+# (creating it first, so that it crashes only once).
+FAKE_TAGGER = '''
+import os.path
+import sys
+
+for line in sys.stdin:
+    token = line.rstrip('\\n')
+    if token == 'CRASH' and not os.path.exists(sys.argv[1]):
+        open(sys.argv[1], 'w+').close()
+        sys.exit(1)
+    if not token:
+        print()
+    elif token[0].isupper():
+        print(token, '<EnamexPrsHum/>', sep='\\t')
+    else:
+        print(token, '', sep='\\t')
+    sys.stdout.flush()
+'''
+
+
+class FinerSessionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        script = os.path.join(self.tmpdir.name, 'finnish-nertag.py')
+        with open(script, 'w+') as fp:
+            fp.write(FAKE_TAGGER)
+        self.command = [
+            sys.executable, script,
+            os.path.join(self.tmpdir.name, 'crashed')]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_annotate(self):
+        with FinerSession(self.command, timeout=10) as session:
+            pid = session.process.pid
+            for i in range(3):
+                self.assertEqual(
+                    annotate([['Mikko', 'asuu', 'Turussa'], ['Hei', '.']],
+                             session=session),
+                    [(1, 1, 1, 'EnamexPrsHum'), (1, 3, 3, 'EnamexPrsHum'),
+                     (2, 1, 1, 'EnamexPrsHum')])
+            # all documents were processed by the same process
+            self.assertEqual(session.process.pid, pid)
+
+    def test_restart(self):
+        with FinerSession(self.command, timeout=10) as session:
+            self.assertEqual(
+                session.tag(['a', 'CRASH', 'B']),
+                [('a', ''), ('CRASH', '<EnamexPrsHum/>'),
+                 ('B', '<EnamexPrsHum/>')])
+            self.assertEqual(session.tag(['C']), [('C', '<EnamexPrsHum/>')])
+
+    def test_pool(self):
+        docs = [('doc{}'.format(i),
+                 [['x'] * (i % 7) + ['Y{}'.format(i)], ['Z', 'z']]) \
+                for i in range(25)]
+        with FinerPool(3, self.command, timeout=10, window=10) as pool:
+            results = list(pool.annotate_docs(docs))
+        self.assertEqual(
+            results,
+            [('doc{}'.format(i),
+              [(1, i % 7 + 1, i % 7 + 1, 'EnamexPrsHum'),
+               (2, 1, 1, 'EnamexPrsHum')]) \
+             for i in range(25)])
+
+
+class FakeFinerHandler(http.server.BaseHTTPRequestHandler):
+    '''
+    Mimics the remote FINER endpoint: reads the `text` field of a
+    multipart form and tags the capitalized tokens as person names.
+    The server's `faults` are injected into the first requests:
+    a number is a delay in seconds, a string an HTTP error status.
+    '''
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        fault = self.server.faults.popleft() if self.server.faults else None
+        if isinstance(fault, str):
+            self.send_error(int(fault))
+            return
+        elif fault is not None:
+            time.sleep(fault)
+        msg = email.message_from_bytes(
+            b'Content-Type: ' + self.headers['Content-Type'].encode() \
+            + b'\r\n\r\n' + body)
+        fields = { part.get_param('name', header='content-disposition') : \
+                     part.get_payload(decode=True).decode('utf-8') \
+                   for part in msg.get_payload() }
+        self.server.requests.append(fields)
+        out = []
+        for token in fields['text'].split('\n'):
+            if not token:
+                out.append('')
+            elif token[0].isupper():
+                out.append(token + '\t<EnamexPrsHum/>')
+            else:
+                out.append(token + '\t')
+        data = '\n'.join(out).encode('utf-8')
+        try:
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except ConnectionError:
+            # the client has timed out
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class RemoteFinerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', 0), FakeFinerHandler)
+        self.server.requests = []
+        self.server.faults = deque()
+        threading.Thread(target=self.server.serve_forever, daemon=True)\
+            .start()
+        self.url = 'http://127.0.0.1:{}/'.format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_annotate_docs(self):
+        docs = [('doc{}'.format(i), [['x'] * (i % 3) + ['Y'], ['Z', 'z']]) \
+                for i in range(10)]
+        with RemoteFiner(self.url, batch_size=4, max_requests=2) as remote:
+            results = list(remote.annotate_docs(docs))
+        self.assertEqual(
+            results,
+            [('doc{}'.format(i),
+              [(1, i % 3 + 1, i % 3 + 1, 'EnamexPrsHum'),
+               (2, 1, 1, 'EnamexPrsHum')]) \
+             for i in range(10)])
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertTrue(all(r['pretokenized'] == 'true' \
+                            for r in self.server.requests))
+
+    def test_retry(self):
+        # the second fault is a timeout, the third one fails the trial
+        # request after the circuit breaker opened
+        self.server.faults.extend(('503', 0.5, '503'))
+        docs = [('doc{}'.format(i), [['Y']]) for i in range(3)]
+        controller = AdaptiveController(1, failure_threshold=2, cooldown=0.1)
+        with RemoteFiner(self.url, batch_size=1, max_requests=1,
+                         timeout=0.2, backoff=0.01,
+                         controller=controller) as remote:
+            results = list(remote.annotate_docs(docs))
+        self.assertEqual(
+            results,
+            [('doc{}'.format(i), [(1, 1, 1, 'EnamexPrsHum')]) \
+             for i in range(3)])
+        self.assertEqual(controller.retries, 3)
+        self.assertEqual(controller.circuit_opened, 2)
+
+    def test_retry_budget(self):
+        self.server.faults.extend(['503'] * 10)
+        controller = AdaptiveController(2, retry_budget=3, cooldown=0.01)
+        with self.assertRaises(RuntimeError):
+            with RemoteFiner(self.url, batch_size=1, max_requests=2,
+                             backoff=0.01, controller=controller) as remote:
+                list(remote.annotate_docs([('doc1', [['Y']])]))
+        self.assertEqual(controller.retries, 3)
+
+    def test_client_error(self):
+        self.server.faults.append('400')
+        with self.assertRaises(RuntimeError):
+            with RemoteFiner(self.url, backoff=0.01) as remote:
+                list(remote.annotate_docs([('doc1', [['Y']])]))